@@ -0,0 +1,42 @@
+import argparse
+import asyncio
+from telegram import Bot
+from telegram.request import HTTPXRequest
+from src.bench.fakeapi import FakeBotApi
+from src.utils.broadcast import Broadcaster
+
+
+# delivers one message to every chat through the real Bot class against the
+# fake Bot API, which enforces its own rate limit with 429s
+async def main(chats: int, rate: int, server_rate: int, concurrency: int, latency: float):
+    api = FakeBotApi(rate=server_rate, latency=latency)
+    await api.start()
+    bot = Bot('123:bench', base_url=api.base_url, request=HTTPXRequest(connection_pool_size=concurrency))
+    await bot.initialize()
+
+    broadcaster = Broadcaster(bot, rate=rate, concurrency=concurrency)
+
+    def progress(report):
+        print(f'{report["total"]}/{chats} chats, {report["throughput"]:.1f} msg/s, '
+              f'{report["retried"]} retried, {report["failed"]} failed')
+
+    try:
+        report = await broadcaster.broadcast(range(1, chats + 1), 'benchmark', progress)
+    finally:
+        await bot.shutdown()
+        await api.close()
+
+    print(f'\nsent {report["sent"]}/{chats} in {report["elapsed"]:.1f}s '
+          f'({report["throughput"]:.1f} msg/s), {report["retried"]} retries, '
+          f'{report["failed"]} failed, {api.limited} requests rejected with 429')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Broadcast benchmark against a fake Bot API server.')
+    parser.add_argument('--chats', type=int, default=100000)
+    parser.add_argument('--rate', type=int, default=1000, help='broadcaster global rate (msg/s)')
+    parser.add_argument('--server-rate', type=int, default=1100, help='fake server limit before 429 (msg/s)')
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--latency', type=float, default=0.01, help='fake server latency (s)')
+    args = parser.parse_args()
+    asyncio.run(main(args.chats, args.rate, args.server_rate, args.concurrency, args.latency))
@@ -0,0 +1,47 @@
+import argparse
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from src.utils.mythreads import ArchiveUpdater
+
+
+# the check every command used to make: a hop to the thread pool taking the
+# two locks guarding the updater flag
+async def executor_check(executor, state_lock, sleep_lock, flag):
+    def current_state():
+        with state_lock:
+            with sleep_lock:
+                return flag[0]
+    return await asyncio.get_running_loop().run_in_executor(executor, current_state)
+
+
+async def generation_check(updater):
+    return updater.generation.updating
+
+
+async def measure(name, check, calls):
+    start = time.perf_counter()
+    for _ in range(calls):
+        await check()
+    elapsed = time.perf_counter() - start
+    print(f'{name}: {elapsed / calls * 1e6:.2f} us per command')
+    return elapsed
+
+
+async def main(calls):
+    executor = ThreadPoolExecutor(max_workers=10)
+    state_lock, sleep_lock, flag = threading.RLock(), threading.RLock(), [True]
+    updater = ArchiveUpdater()
+
+    before = await measure('executor + locks', lambda: executor_check(executor, state_lock, sleep_lock, flag), calls)
+    after = await measure('generation read', lambda: generation_check(updater), calls)
+    print(f'{before / after:.0f}x less overhead per command')
+    executor.shutdown()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Per-command cost of the dataset state check.')
+    parser.add_argument('--calls', type=int, default=100000)
+    args = parser.parse_args()
+    asyncio.run(main(args.calls))
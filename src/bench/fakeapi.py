@@ -0,0 +1,133 @@
+import asyncio
+import itertools
+import json
+import re
+import time
+from collections import Counter
+from urllib.parse import parse_qsl
+from src.utils.httpserver import HttpServer
+
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'LEXArchive', 'username': 'lexarchive_bot'}
+MULTIPART_CHAT = re.compile(rb'name="chat_id"\r\n\r\n(-?\d+)')
+
+
+# local stand-in for the Telegram Bot API, for benchmarks: answers every
+# method the bot uses with a well formed result, can add latency and returns
+# 429 with retry_after when more than rate requests per second come in.
+# Updates queued with push_update are handed out by getUpdates (long polling
+# included), and the time of the last message sent to each chat is kept.
+class FakeBotApi:
+
+    def __init__(self, rate=None, latency=0.0, retry_after=1, port=0):
+        self._server = HttpServer(self._handle, port=port, max_body=64 * 1024 * 1024)
+        self._rate = rate
+        self._latency = latency
+        self._retry_after = retry_after
+        self._window = 0
+        self._window_count = 0
+        self._ids = itertools.count(1)
+        self._updates = []
+        self._arrived = asyncio.Event()
+        self.calls = Counter()
+        self.limited = 0
+        self.answered = {}
+
+    @property
+    def base_url(self) -> str:
+        return f'http://127.0.0.1:{self._server.port}/bot'
+
+    async def start(self):
+        await self._server.start()
+
+    async def close(self):
+        await self._server.close()
+
+    def push_update(self, update: dict):
+        self._updates.append(update)
+        self._arrived.set()
+
+    async def _get_updates(self, params: dict) -> list:
+        offset = int(params.get('offset', 0) or 0)
+        limit = int(params.get('limit', 100) or 100)
+        timeout = min(float(params.get('timeout', 0) or 0), 1.0)
+        # a getUpdates with an offset confirms everything before it
+        self._updates = [update for update in self._updates if update['update_id'] >= offset]
+        if not self._updates and timeout > 0:
+            self._arrived.clear()
+            try:
+                await asyncio.wait_for(self._arrived.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self._updates[:limit]
+
+    @staticmethod
+    def _params(request) -> dict:
+        content_type = request.headers.get('content-type', '')
+        if content_type.startswith('application/json'):
+            return json.loads(request.body or b'{}')
+        if content_type.startswith('multipart/form-data'):
+            match = MULTIPART_CHAT.search(request.body)
+            return {'chat_id': match.group(1).decode()} if match else {}
+        return dict(parse_qsl(request.body.decode()))
+
+    def _limited(self) -> bool:
+        if self._rate is None:
+            return False
+        window = int(time.monotonic())
+        if window != self._window:
+            self._window, self._window_count = window, 0
+        self._window_count += 1
+        return self._window_count > self._rate
+
+    def _message(self, params: dict, **content) -> dict:
+        chat_id = int(params.get('chat_id', 0) or 0)
+        message = {
+            'message_id': next(self._ids),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'}
+        }
+        message.update(content)
+        return message
+
+    def _file(self, kind: str) -> dict:
+        n = next(self._ids)
+        return {'file_id': f'{kind}-{n}', 'file_unique_id': f'u{kind}-{n}', 'width': 1, 'height': 1}
+
+    def _result(self, method: str, params: dict):
+        if method == 'getMe':
+            return BOT_USER
+        if method in ('sendMessage', 'editMessageText'):
+            self.answered[int(params.get('chat_id', 0) or 0)] = time.perf_counter()
+            return self._message(params, text=params.get('text', ''))
+        if method in ('sendPhoto', 'editMessageMedia'):
+            return self._message(params, photo=[self._file('photo')])
+        if method == 'editMessageCaption':
+            return self._message(params, caption=params.get('caption', ''))
+        if method == 'sendDocument':
+            document = self._file('document')
+            return self._message(params, document={'file_id': document['file_id'], 'file_unique_id': document['file_unique_id']})
+        return True
+
+    async def _handle(self, request):
+        method = request.path.rstrip('/').rsplit('/', 1)[-1]
+        self.calls[method] += 1
+        if self._latency > 0:
+            await asyncio.sleep(self._latency)
+
+        if method not in ('getMe', 'getUpdates') and self._limited():
+            self.limited += 1
+            body = {
+                'ok': False,
+                'error_code': 429,
+                'description': f'Too Many Requests: retry after {self._retry_after}',
+                'parameters': {'retry_after': self._retry_after}
+            }
+            return 429, 'application/json', json.dumps(body).encode()
+
+        params = self._params(request)
+        if method == 'getUpdates':
+            result = await self._get_updates(params)
+        else:
+            result = self._result(method, params)
+        body = {'ok': True, 'result': result}
+        return 200, 'application/json', json.dumps(body).encode()
@@ -0,0 +1,76 @@
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+TARGET = 'src.bot.tgbot'
+# loaded on first use (or by the warm-up), never by the import itself
+LAZY = ('astropy', 'astroquery', 'matplotlib', 'playwright', 'requests')
+# (module, attribute) of every SQLite store: none may be connected by the import
+STORES = (
+    ('src.datamanagement.database.DbManager', 'db'),
+    ('src.datamanagement.database.SubManager', 'db'),
+    ('src.bot.tgbot', 'file_ids'),
+    ('src.utils.img3d', 'store')
+)
+CHECK = (
+    'import sys, json, {target}\n'
+    'print(json.dumps(sorted(name for name in sys.modules if name.split(".")[0] in {lazy!r})))\n'
+    'stores = [(getattr(sys.modules.get(module), name, None), module + "." + name) for module, name in {stores!r}]\n'
+    'print(json.dumps([name for store, name in stores if store is not None and store.conn is not None]))'
+)
+
+
+# one cold interpreter per run: -X importtime writes "self | cumulative | name"
+# (microseconds) to stderr for every module imported
+def measure(target: str) -> tuple:
+    code = CHECK.format(target=target, lazy=LAZY, stores=STORES)
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        modules[name.strip()] = (int(own), int(cumulative))
+    loaded, opened = [json.loads(line) for line in result.stdout.splitlines()[-2:]]
+    return modules, loaded, opened
+
+
+def main(runs: int, top: int, budget: float, target: str) -> int:
+    totals = []
+    modules = loaded = opened = None
+    for _ in range(runs):
+        modules, loaded, opened = measure(target)
+        totals.append(modules[target][1] / 1000)
+
+    print(f'import {target}: median {statistics.median(totals):.0f} ms, '
+          f'min {min(totals):.0f} ms, max {max(totals):.0f} ms over {runs} runs')
+    print(f'\n{"self ms":>9}{"total ms":>10}  module')
+    for name, (own, cumulative) in sorted(modules.items(), key=lambda item: -item[1][0])[:top]:
+        print(f'{own / 1000:>9.1f}{cumulative / 1000:>10.1f}  {name}')
+
+    failed = False
+    if loaded:
+        print(f'\nimported eagerly: {", ".join(loaded)}')
+        failed = True
+    if opened:
+        print(f'\nopened on import: {", ".join(opened)}')
+        failed = True
+    if budget and statistics.median(totals) > budget:
+        print(f'\nover the {budget:.0f} ms budget')
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Cold import time of the bot, failing if heavy modules load eagerly.')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15, help='modules to list, by their own import time')
+    parser.add_argument('--budget', type=float, default=0, help='fail above this median (ms), 0 for no limit')
+    parser.add_argument('--target', default=TARGET)
+    args = parser.parse_args()
+    sys.exit(main(args.runs, args.top, args.budget, args.target))
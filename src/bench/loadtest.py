@@ -0,0 +1,239 @@
+import argparse
+import asyncio
+import logging
+import os
+import random
+import tempfile
+import time
+from collections import defaultdict
+from io import BytesIO
+from telegram import Update
+from src.bench.fakeapi import FakeBotApi
+from src.bot import tgbot, workers
+from src.datamanagement.database import DbManager as db
+from src.datamanagement.database.FileIdStore import FileIdStore
+from src.utils import research, mythreads
+
+DEFAULT_MIX = 'search=30,page=20,table=15,hab=15,plot=5,locate=15'
+LAG_INTERVAL = 0.01
+# smallest valid PNG, stands in for the SkyView picture
+PIXEL = bytes.fromhex(
+    '89504e470d0a1a0a0000000d4948445200000001000000010806000000'
+    '1f15c4890000000d49444154789c6360000002000001e221bc330000000049454e44ae426082'
+)
+
+
+async def _fake_sky_image(coord, constellation):
+    return BytesIO(PIXEL)
+
+
+def _user(chat_id: int) -> dict:
+    return {'id': chat_id, 'is_bot': False, 'first_name': f'load{chat_id}'}
+
+
+def _chat(chat_id: int) -> dict:
+    return {'id': chat_id, 'type': 'private'}
+
+
+def command_update(update_id: int, chat_id: int, text: str) -> dict:
+    command = text.split()[0]
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': _chat(chat_id),
+            'from': _user(chat_id),
+            'text': text,
+            'entities': [{'type': 'bot_command', 'offset': 0, 'length': len(command)}]
+        }
+    }
+
+
+def button_update(update_id: int, chat_id: int, data: str) -> dict:
+    return {
+        'update_id': update_id,
+        'callback_query': {
+            'id': str(update_id),
+            'from': _user(chat_id),
+            'chat_instance': str(chat_id),
+            'data': data,
+            'message': {
+                'message_id': update_id,
+                'date': int(time.time()),
+                'chat': _chat(chat_id),
+                'text': 'Available Planets',
+                'reply_markup': {'inline_keyboard': [[
+                    {'text': '< Previous Page', 'callback_data': 'prev_page_btn'},
+                    {'text': 'Next Page >', 'callback_data': 'next_page_btn'}
+                ]]}
+            }
+        }
+    }
+
+
+def parse_mix(mix: str) -> dict:
+    weights = {}
+    for pair in mix.split(','):
+        name, weight = pair.split('=')
+        weights[name.strip()] = int(weight)
+    return weights
+
+
+# (kind, update) pairs following the weights of the mix
+def generate(weights: dict, updates: int, chats: int, planets: list, seed: int):
+    rng = random.Random(seed)
+    kinds = list(weights)
+    criteria = list(tgbot.plot_supported)
+    for update_id in range(1, updates + 1):
+        kind = rng.choices(kinds, [weights[k] for k in kinds])[0]
+        chat_id = rng.randint(1, chats)
+        planet = rng.choice(planets)
+        if kind == 'search':
+            yield kind, command_update(update_id, chat_id, f'/search {planet[:rng.randint(1, 3)]}')
+        elif kind == 'page':
+            yield kind, button_update(update_id, chat_id, 'next_page_btn')
+        elif kind == 'table':
+            yield kind, command_update(update_id, chat_id, f'/table {planet[:4]}')
+        elif kind == 'hab':
+            yield kind, command_update(update_id, chat_id, f'/hab {planet}')
+        elif kind == 'plot':
+            yield kind, command_update(update_id, chat_id, f'/plot {rng.choice(criteria)}')
+        elif kind == 'locate':
+            yield kind, command_update(update_id, chat_id, f'/locate {planet}')
+        else:
+            raise ValueError(f'unknown command kind {kind}')
+
+
+async def _watch_lag(lags: list, stop: asyncio.Event):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(LAG_INTERVAL)
+        lags.append(time.perf_counter() - start - LAG_INTERVAL)
+
+
+def _percentile(values: list, p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p * len(values)))]
+
+
+# nothing of the run is persisted and SkyView is never contacted; also the
+# setup of every worker process with --workers
+def stub():
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+    research.fetch_sky_image = _fake_sky_image
+    tgbot.file_ids = FileIdStore(os.path.join(tempfile.mkdtemp(), 'fileids.sqlite'))
+
+
+async def _run_local(api: FakeBotApi, work, concurrency: int, slots: int, latencies: dict, errors: dict):
+    application = tgbot.build_application('123:loadtest', base_url=api.base_url, concurrent_updates=slots)
+
+    async def on_error(update, context):
+        errors[type(context.error).__name__] += 1
+
+    application.add_error_handler(on_error)
+    await application.initialize()
+    tgbot.updater.generation = mythreads.Generation(1, False, time.time())
+
+    # the way Application.start would run them: through the update
+    # processor, so per-chat ordering and its slot limit are part of the run
+    processor = application.update_processor
+
+    async def worker():
+        for kind, data in work:
+            update = Update.de_json(data, application.bot)
+            start = time.perf_counter()
+            await processor.process_update(update, application.process_update(update))
+            latencies[kind].append(time.perf_counter() - start)
+
+    try:
+        start = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+        return time.perf_counter() - start
+    finally:
+        await application.shutdown()
+
+
+# same mix through src/bot/workers.py: this process routes, the workers
+# handle the updates and report how long each one took
+async def _run_workers(api: FakeBotApi, work, count: int, latencies: dict):
+    pool = workers.WorkerPool('123:loadtest', count, base_url=api.base_url, setup=stub, report=True)
+    pool.start()
+    pool.publish(mythreads.Generation(1, False, time.time()))
+
+    async def handled(n: int):
+        return [await asyncio.to_thread(pool.results.get) for _ in range(n)]
+
+    try:
+        # one /help per worker first, so their startup isn't part of the run
+        for index in range(count):
+            await pool.dispatch(Update.de_json(command_update(-1 - index, index, '/help'), None))
+        await handled(count)
+
+        kinds = {}
+        start = time.perf_counter()
+        for kind, data in work:
+            kinds[data['update_id']] = kind
+            await pool.dispatch(Update.de_json(data, None))
+        for update_id, seconds in await handled(len(kinds)):
+            latencies[kinds[update_id]].append(seconds)
+        return time.perf_counter() - start
+    finally:
+        await pool.close()
+
+
+async def main(updates: int, chats: int, concurrency: int, mix: str, latency: float, seed: int, slots: int,
+               count: int):
+    planets = sorted(db.get_names_set() or ())
+    if not planets:
+        print('The archive is empty, run the bot once (or copy a db.sqlite) before load testing.')
+        return
+
+    stub()
+    api = FakeBotApi(latency=latency)
+    await api.start()
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    work = iter(generate(parse_mix(mix), updates, chats, planets, seed))
+
+    lags, stop = [], asyncio.Event()
+    watcher = asyncio.create_task(_watch_lag(lags, stop))
+    try:
+        if count > 1:
+            elapsed = await _run_workers(api, work, count, latencies)
+        else:
+            elapsed = await _run_local(api, work, concurrency, slots, latencies, errors)
+    finally:
+        stop.set()
+        await watcher
+        await api.close()
+
+    total = sum(len(values) for values in latencies.values())
+    setup = f'{count} worker processes' if count > 1 else f'{concurrency} in flight, {slots} slots'
+    print(f'{total} updates in {elapsed:.1f}s: {total / elapsed:.1f} updates/s, {setup}')
+    print(f'{"command":<10}{"count":>8}{"p50 ms":>10}{"p99 ms":>10}')
+    for kind in sorted(latencies):
+        values = latencies[kind]
+        print(f'{kind:<10}{len(values):>8}{_percentile(values, 0.5) * 1e3:>10.1f}{_percentile(values, 0.99) * 1e3:>10.1f}')
+    print(f'event loop lag: p50 {_percentile(lags, 0.5) * 1e3:.1f} ms, p99 {_percentile(lags, 0.99) * 1e3:.1f} ms, '
+          f'max {max(lags, default=0) * 1e3:.1f} ms')
+    print(f'Bot API calls: {dict(api.calls)}')
+    if errors:
+        print(f'errors: {dict(errors)}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Replay a synthetic command mix through the real handlers.')
+    parser.add_argument('--updates', type=int, default=5000)
+    parser.add_argument('--chats', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='kind=weight list, kinds: search page table hab plot locate')
+    parser.add_argument('--latency', type=float, default=0.02, help='fake Bot API latency (s)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--slots', type=int, default=tgbot.CONCURRENT_UPDATES, help='updates handled at once, 1 is sequential')
+    parser.add_argument('--workers', type=int, default=0, help='worker processes (src/bot/workers.py), 0 runs in process')
+    args = parser.parse_args()
+    asyncio.run(main(args.updates, args.chats, args.concurrency, args.mix, args.latency, args.seed, args.slots,
+                     args.workers))
@@ -0,0 +1,28 @@
+import argparse
+import time
+from src.utils import metrics
+
+
+# cost of one sample for each kind of instrumentation
+def main(samples: int):
+    histogram = metrics.Histogram('bench_seconds', 'bench', 'command')
+    counter = metrics.Counter('bench_total', 'bench', 'command')
+
+    cases = (
+        ('histogram.observe', lambda: histogram.observe(0.003, 'count')),
+        ('histogram.time', lambda: histogram.time('count').__enter__().__exit__(None, None, None)),
+        ('counter.inc', lambda: counter.inc('count'))
+    )
+    for name, sample in cases:
+        start = time.perf_counter()
+        for _ in range(samples):
+            sample()
+        elapsed = time.perf_counter() - start
+        print(f'{name}: {elapsed / samples * 1e6:.3f} us per sample')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Per-sample cost of the metrics layer.')
+    parser.add_argument('--samples', type=int, default=1000000)
+    args = parser.parse_args()
+    main(args.samples)
@@ -0,0 +1,136 @@
+import argparse
+import asyncio
+import json
+import logging
+import secrets
+import time
+import httpx
+from src.bench.fakeapi import FakeBotApi
+from src.bench.loadtest import command_update, _percentile
+from src.bot import tgbot
+from src.bot.webhook import WebhookReceiver, SECRET_HEADER
+
+PATH = '/telegram'
+RETRY_DELAY = 0.05
+
+
+# every update comes from its own chat, so the /help reply sent to that chat
+# marks the end of its round trip
+async def _feed(deliver, updates: int, rate: float, sent: dict):
+    interval = 1 / rate if rate > 0 else 0
+    start = time.perf_counter()
+    tasks = []
+    for n in range(1, updates + 1):
+        sent[n] = time.perf_counter()
+        tasks.append(asyncio.create_task(deliver(command_update(n, n, '/help'))))
+        if interval:
+            await asyncio.sleep(max(0.0, start + n * interval - time.perf_counter()))
+    await asyncio.gather(*tasks)
+
+
+async def _wait_answers(api: FakeBotApi, updates: int, timeout: float):
+    deadline = time.perf_counter() + timeout
+    while len(api.answered) < updates and time.perf_counter() < deadline:
+        await asyncio.sleep(0.01)
+
+
+async def run_polling(api: FakeBotApi, updates: int, rate: float, queue_size: int, timeout: float):
+    application = tgbot.build_application('123:polling', base_url=api.base_url, update_queue=asyncio.Queue(queue_size))
+    await application.initialize()
+    await application.start()
+    await application.updater.start_polling(poll_interval=0, timeout=1)
+
+    async def deliver(update):
+        api.push_update(update)
+
+    sent = {}
+    try:
+        await _feed(deliver, updates, rate, sent)
+        await _wait_answers(api, updates, timeout)
+    finally:
+        await application.updater.stop()
+        await application.stop()
+        await application.shutdown()
+    return sent, {}
+
+
+async def run_webhook(api: FakeBotApi, updates: int, rate: float, queue_size: int, timeout: float, concurrency: int):
+    application = tgbot.build_application('123:webhook', base_url=api.base_url, update_queue=asyncio.Queue(queue_size))
+    secret = secrets.token_urlsafe(32)
+    receiver = WebhookReceiver(application, PATH, secret, port=0, gate=application.update_processor)
+    await application.initialize()
+    await application.start()
+    await receiver.start()
+
+    # stands in for Telegram: a few connections at most, and a 503 means the
+    # same update is sent again a bit later
+    limits = httpx.Limits(max_connections=concurrency)
+    client = httpx.AsyncClient(base_url=f'http://127.0.0.1:{receiver.port}', limits=limits)
+    headers = {SECRET_HEADER: secret, 'content-type': 'application/json'}
+    statuses = {}
+    connections = asyncio.Semaphore(concurrency)
+
+    async def deliver(update):
+        body = json.dumps(update).encode()
+        while True:
+            async with connections:
+                response = await client.post(PATH, content=body, headers=headers)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            if response.status_code != 503:
+                return
+            await asyncio.sleep(RETRY_DELAY)
+
+    sent = {}
+    try:
+        # a wrong secret has to be refused before anything is queued
+        response = await client.post(PATH, content=b'{}', headers={SECRET_HEADER: 'wrong'})
+        assert response.status_code == 403, response.status_code
+        await _feed(deliver, updates, rate, sent)
+        await _wait_answers(api, updates, timeout)
+    finally:
+        await client.aclose()
+        await receiver.close()
+        await application.stop()
+        await application.shutdown()
+    return sent, statuses
+
+
+def _report(mode: str, api: FakeBotApi, sent: dict, statuses: dict):
+    latencies = [api.answered[n] - sent[n] for n in sent if n in api.answered]
+    if not latencies:
+        print(f'{mode:<8} no update answered')
+        return
+    elapsed = max(api.answered.values()) - min(sent.values())
+    line = (f'{mode:<8}{len(latencies):>8}{len(latencies) / elapsed:>10.1f}'
+            f'{_percentile(latencies, 0.5) * 1e3:>10.1f}{_percentile(latencies, 0.99) * 1e3:>10.1f}')
+    if statuses:
+        line += f'   responses {statuses}'
+    print(line)
+
+
+async def main(updates: int, rate: float, queue_size: int, latency: float, concurrency: int, timeout: float):
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+    print(f'{"mode":<8}{"answered":>8}{"upd/s":>10}{"p50 ms":>10}{"p99 ms":>10}')
+    for mode in ('polling', 'webhook'):
+        api = FakeBotApi(latency=latency)
+        await api.start()
+        try:
+            if mode == 'polling':
+                sent, statuses = await run_polling(api, updates, rate, queue_size, timeout)
+            else:
+                sent, statuses = await run_webhook(api, updates, rate, queue_size, timeout, concurrency)
+        finally:
+            await api.close()
+        _report(mode, api, sent, statuses)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare long polling and webhook delivery against a fake Bot API.')
+    parser.add_argument('--updates', type=int, default=2000)
+    parser.add_argument('--rate', type=float, default=200, help='updates per second, 0 sends them all at once')
+    parser.add_argument('--queue-size', type=int, default=100)
+    parser.add_argument('--latency', type=float, default=0.005, help='fake Bot API latency (s)')
+    parser.add_argument('--concurrency', type=int, default=40, help='webhook connections, like max_connections')
+    parser.add_argument('--timeout', type=float, default=60, help='seconds to wait for the last answers')
+    args = parser.parse_args()
+    asyncio.run(main(args.updates, args.rate, args.queue_size, args.latency, args.concurrency, args.timeout))
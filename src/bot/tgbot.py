@@ -1,24 +1,31 @@
 import logging
 import asyncio
-import os
-import threading
-import uuid
 import re
-import queue
-import matplotlib.pyplot as plt
+import sqlite3
+import hashlib
+import signal
 from datetime import datetime
+from io import BytesIO
 from logging.handlers import RotatingFileHandler
-from concurrent.futures import ThreadPoolExecutor
 from telegram import (
-    Update, InlineKeyboardButton, InlineKeyboardMarkup,
-    InlineQueryResultArticle, InputTextMessageContent
+    Update, InlineKeyboardButton, InlineKeyboardMarkup, InputMediaPhoto, Message
 )
+from telegram.error import TelegramError, BadRequest
 from telegram.ext import (
     ContextTypes, ApplicationBuilder, CommandHandler, MessageHandler,
     filters, CallbackContext, CallbackQueryHandler, InlineQueryHandler
 )
 from src.datamanagement.database import DbManager as db
-from src.utils import text, mythreads, research, img3d
+from src.datamanagement.database import SubManager as sdb
+from src.datamanagement.database.FileIdStore import FileIdStore
+from src.utils import text, mythreads, research, img3d, news, export, inlineindex, metrics, profiling
+from src.utils.renderscheduler import RenderLimitError
+from src.utils.broadcast import Broadcaster
+from src.utils.dispatcher import ChatOrderedProcessor
+from src.utils.sessions import SessionStore
+from src.utils.responsecache import ResponseCache
+from src.utils.httpserver import HttpServer
+from src.bot import webhook, workers
 
 # _____________________________LOGGING________________________________________
 
@@ -42,15 +49,22 @@ MIN_YEAR = 1900
 
 TOKEN_PATH = 'resources/config/token.txt'
 FIELDS_PATH = 'resources/config/fields.txt'
-SUB_PATH = 'resources/data/subscribers.txt'
 DEF_PATH = 'resources/config/definitions.txt'
 INFO_PATH = 'resources/config/commands_info.txt'
-IMG_DIR = 'resources/img/'
-search_data = {}
+ADMINS_PATH = 'resources/config/admins.txt'
+SESSIONS_PATH = 'resources/data/sessions.txt'
+MAX_FULL_EXPORTS = 2
+METRICS_PORT = 9464
+# updates of different chats handled at the same time, see src/utils/dispatcher.py
+CONCURRENT_UPDATES = 32
+# import astropy & co. and open the archive right after startup instead of
+# on the first command needing them
+WARM_UP = True
 SEARCH_LIMIT = 25
 fields_ = {}
 definitions = {}
 comm_infos = {}
+admins = set()
 plot_supported = {
     'emass': 'pl_bmasse',
     'jmass': 'pl_bmassj',
@@ -61,67 +75,81 @@ plot_supported = {
     'smass': 'st_mass'
 }
 
-htmlLock = asyncio.Lock()
 pngLock = asyncio.Lock()
-subLock = threading.RLock()
-newsLock = threading.RLock()
-state_lock = threading.RLock()
-updater_ids_lock = threading.RLock()
-executor = ThreadPoolExecutor(max_workers=10)
+full_exports = asyncio.Semaphore(MAX_FULL_EXPORTS)
+sessions = SessionStore(path=SESSIONS_PATH, page_size=SEARCH_LIMIT)
 updater = mythreads.ArchiveUpdater()
-
-MAX_SUBPROCESSES = 5
-subprocess_queue = queue.Queue(maxsize=MAX_SUBPROCESSES)
+background_tasks = set()
+news_scheduler = None
+inline_index = None
+response_cache = ResponseCache()
+file_ids = FileIdStore()
+metrics_server = None
+inline_index_lock = asyncio.Lock()
 
 # _____________________________FUNCTIONS______________________________________
 
-def reset_search(id):
-    search_data[id] = {
-        'start': 0,
-        'end': SEARCH_LIMIT,
-        'last': None,
-        'searched': None
-    }
+def register_user(chat_id):
+    sessions.get(chat_id)
 
 
-def read_subs():
-    with subLock:
-        try:
-            with open(SUB_PATH, 'r') as file:
-                return file.readlines()
-        except IOError as e:
-            print(f'Error reading subscription file: {e}')
-            return None
+# replies of deterministic commands, as a tuple of (text, markdown) messages
+def cached(command: str, args=None):
+    return response_cache.get(updater.generation.number, command, args)
 
 
-def write_subs(subs: list):
-    with subLock:
-        try:
-            with open(SUB_PATH, 'w') as file:
-                file.writelines(subs)
-                return True
-        except IOError as e:
-            print(f'Error reading subscription file: {e}')
-            return False
+def remember(command: str, args, messages: tuple) -> tuple:
+    response_cache.put(updater.generation.number, command, args, messages)
+    return messages
 
 
-def current_state() -> bool:
-    with state_lock:
-        return updater.is_sleeping()
+async def send_all(update: Update, context: ContextTypes.DEFAULT_TYPE, messages: tuple) -> None:
+    for msg, parsing in messages:
+        await send(update, context, msg, parsing)
 
 
-async def register_user(chat_id):
-    if chat_id not in search_data:
-        reset_search(chat_id)
-        await asyncio.get_event_loop().run_in_executor(executor, updater.add_id, chat_id)
+def asset_key(*parts) -> str:
+    return hashlib.sha1('|'.join(str(part) for part in parts).encode()).hexdigest()
 
 
-async def send(update: Update, context: ContextTypes.DEFAULT_TYPE, msg: str, parsing: bool) -> None:
-    await context.bot.send_message(
+# sends a picture uploaded before by its file_id, False if there's none or
+# Telegram doesn't know it anymore
+async def send_known_photo(update: Update, context: ContextTypes.DEFAULT_TYPE, key: str, caption=None, parse_mode=None) -> bool:
+    file_id = file_ids.get(key)
+    if file_id is None:
+        return False
+    try:
+        await context.bot.send_photo(
+            chat_id=update.effective_user.id,
+            photo=file_id,
+            caption=caption,
+            parse_mode=parse_mode
+        )
+        return True
+    except BadRequest as e:
+        print(f'Error sending file {file_id}: {e}')
+        file_ids.forget(key)
+        return False
+
+
+async def send_new_photo(update: Update, context: ContextTypes.DEFAULT_TYPE, key: str, photo, caption=None, parse_mode=None):
+    message = await context.bot.send_photo(
         chat_id=update.effective_user.id,
-        text=msg,
-        parse_mode='Markdown' if parsing else None
+        photo=photo,
+        caption=caption,
+        parse_mode=parse_mode
     )
+    file_ids.put(key, message.photo[-1].file_id)
+    return message
+
+
+async def send(update: Update, context: ContextTypes.DEFAULT_TYPE, msg: str, parsing: bool) -> None:
+    with metrics.send_seconds.time():
+        await context.bot.send_message(
+            chat_id=update.effective_user.id,
+            text=msg,
+            parse_mode='Markdown' if parsing else None
+        )
 
 async def send_internal_server_error_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     await context.bot.send_message(
@@ -131,8 +159,7 @@ async def send_internal_server_error_message(update: Update, context: ContextTyp
     )
 
 async def notify_user_if_updating(update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
-    sleeping = await asyncio.get_event_loop().run_in_executor(executor, current_state)
-    if not sleeping:
+    if updater.generation.updating:
         msg = 'We\'re currently updating the database, all commands are unavailable. We\'ll be back in a moment.'
         await send(update, context, msg, False)
         return True
@@ -141,7 +168,7 @@ async def notify_user_if_updating(update: Update, context: ContextTypes.DEFAULT_
 # ____________________________ACTUAL COMMANDS_________________________________
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    await register_user(update.effective_user.id)
+    register_user(update.effective_user.id)
 
     msg = (
         '🌌 *Welcome to LEXArchive!* 🚀\n\n'
@@ -158,7 +185,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
 
 async def help(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    await register_user(update.effective_user.id)
+    register_user(update.effective_user.id)
 
     msg = (
         "General Commands:\n"
@@ -187,7 +214,7 @@ async def help(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
 
 async def info(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    await register_user(update.effective_user.id)
+    register_user(update.effective_user.id)
 
     if len(context.args) == 0:
         await send(update, context, '*Invalid Syntax*: You need to search for one or more commands.', True)
@@ -201,7 +228,7 @@ async def info(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
 # count how many planets were discovered
 async def count(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    await register_user(update.effective_user.id)
+    register_user(update.effective_user.id)
 
     if await notify_user_if_updating(update, context):
         return
@@ -211,22 +238,25 @@ async def count(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         return
 
     is_total_count = True if update.message.text == '/count' else False
-    if is_total_count:
-        rows = db.count('ps')
-    else:
-        rows = db.count('pscomppars')
+    table = 'ps' if is_total_count else 'pscomppars'
+    messages = cached('count', table)
+    if messages is None:
+        rows = db.count(table)
+        if rows is None:
+            await send_internal_server_error_message(update, context)
+            return
+        messages = ()
+        if rows != -1:
+            msg = f'The archive counts *{rows}* different exoplanets discovered.' if not is_total_count else f'The archive counts *{rows}* records.'
+            messages = ((msg, True),)
+        remember('count', table, messages)
 
-    if rows is None:
-        await send_internal_server_error_message(update, context)
-        return
-    elif rows != -1:
-        msg = f'The archive counts *{rows}* different exoplanets discovered.' if not is_total_count else f'The archive counts *{rows}* records.'
-        await send(update, context, msg, True)
+    await send_all(update, context, messages)
 
 
 # count how many planets were discovered in a certain year
 async def disc_in(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    await register_user(update.effective_user.id)
+    register_user(update.effective_user.id)
 
     if await notify_user_if_updating(update, context):
         return
@@ -245,32 +275,39 @@ async def disc_in(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         await send(update, context, '*Invalid Syntax:* You need to specify a valid year.', True)
         return
 
-    rows = db.disc_in(year)
-    if rows is None:
-        await send_internal_server_error_message(update, context)
-        return
-    elif rows != -1:
-        msg = f'The archive counts *{rows}* different exoplanets discovered in {year}.'
-        await send(update, context, msg, True)
+    messages = cached('discin', year)
+    if messages is None:
+        rows = db.disc_in(year)
+        if rows is None:
+            await send_internal_server_error_message(update, context)
+            return
+        messages = ()
+        if rows != -1:
+            messages = ((f'The archive counts *{rows}* different exoplanets discovered in {year}.', True),)
+        remember('discin', year, messages)
+
+    await send_all(update, context, messages)
 
 
 # returns a list of planet with buttons to iterate it
 async def search(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    await register_user(update.effective_user.id)
+    register_user(update.effective_user.id)
 
     if await notify_user_if_updating(update, context):
         return
 
     keyword = None if len(context.args) == 0 else (''.join(context.args)).lower()
     chat = update.effective_user.id
-    if chat in search_data and search_data[chat]['last'] is not None:
-        await context.bot.delete_message(
-            chat_id=chat,
-            message_id=search_data[chat]['last']
-        )
-    reset_search(chat)
+    session = sessions.get(chat)
+    if session.last is not None:
+        try:
+            await context.bot.delete_message(chat_id=chat, message_id=session.last)
+        except TelegramError as e:
+            # already deleted, or too old to be deleted by a bot
+            print(f'Error deleting search message in {chat}: {e}')
+    session.reset(SEARCH_LIMIT)
 
-    st, end = search_data[chat]['start'], search_data[chat]['end']
+    st, end = session.start, session.end
     rows = db.search_pl(st, end, keyword)
     if rows is None:
         await send_internal_server_error_message(update, context)
@@ -298,13 +335,13 @@ async def search(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         text='Available Planets:\n\n' + string,
         reply_markup=reply_markup
     )
-    search_data[chat]['last'] = message.message_id
-    search_data[chat]['searched'] = keyword
+    session.last = message.message_id
+    session.searched = keyword
 
 
 # button listener for the search command
 async def button_listener(update: Update, context: CallbackContext) -> None:
-    await register_user(update.effective_user.id)
+    register_user(update.effective_user.id)
 
     if await notify_user_if_updating(update, context):
         return
@@ -312,8 +349,9 @@ async def button_listener(update: Update, context: CallbackContext) -> None:
     query = update.callback_query
 
     chat = query.message.chat.id
-    keyword = search_data[chat]['searched']
-    st, end = search_data[chat]['start'], search_data[chat]['end']
+    session = sessions.get(chat)
+    keyword = session.searched
+    st, end = session.start, session.end
     rows = db.count_like(keyword)
 
     if query.data == 'next_page_btn' and end < rows:
@@ -323,8 +361,8 @@ async def button_listener(update: Update, context: CallbackContext) -> None:
     else:
         return
 
-    search_data[chat]['start'] = st
-    search_data[chat]['end'] = end
+    session.start = st
+    session.end = end
 
     rows = db.search_pl(st, end, keyword)
 
@@ -343,16 +381,35 @@ async def button_listener(update: Update, context: CallbackContext) -> None:
 
 # returns an html table retrieving some records of a specific planet
 async def table(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    await register_user(update.effective_user.id)
+    register_user(update.effective_user.id)
 
     if await notify_user_if_updating(update, context):
         return
 
-    if len(context.args) == 0:
+    fmt = None
+    full = False
+    args = list(context.args)
+    if len(args) >= 2 and args[-2] == '-f':
+        fmt = args[-1].lower()
+        args = args[:-2]
+        if fmt not in export.FORMATS:
+            await send(update, context, f'*Invalid Format:* choose one of {", ".join(export.FORMATS)}.', True)
+            return
+    if args and args[-1] == '-a':
+        full = True
+        args = args[:-1]
+    if fmt is None:
+        fmt = export.FULL_FORMAT if full else export.DEFAULT_FORMAT
+
+    if len(args) == 0:
         await send(update, context, '*Invalid Syntax:* You need to specify at least one search string.', True)
         return
 
-    keyword = ''.join(context.args).lower()
+    keyword = ''.join(args).lower()
+    if full:
+        await send_full_table(update, context, keyword, fmt)
+        return
+
     rows, exceeds = db.get_pl_by_name(keyword)
 
     if rows is None:
@@ -362,25 +419,53 @@ async def table(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         await send(update, context, 'No record has been found.', False)
         return
 
-    for i in range(len(rows)):
-        rows[i] = rows[i][1:-1]
+    # the id column isn't in fields_, every other one is
+    document = export.export_table(fields_, (row[1:] for row in rows), fmt, exceeds)
+    await context.bot.send_document(
+        chat_id=update.effective_user.id,
+        document=document,
+        filename=f'table-{keyword}.{fmt}'
+    )
+    # html tables carry the note in their footer, the other formats can't
+    if exceeds and fmt != 'html':
+        msg = (f'Only the first {db.Database.limit()} records are in this file. Add -a to the /table command to get '
+               f'all of them.')
+        await send(update, context, msg, False)
 
-    string = text.htable_format([fields_[key] for key in fields_], rows, exceeds)
-    filename = f'table-{keyword}.html'
-    async with htmlLock:
-        with open(filename, 'w') as file:
-            file.write(string)
 
-        await context.bot.send_document(
-            chat_id=update.effective_user.id,
-            document=filename
-        )
-        os.remove(filename)
+# every matching row, read and compressed in a worker thread one part at a
+# time: only the part being uploaded is kept in memory
+async def send_full_table(update: Update, context: ContextTypes.DEFAULT_TYPE, keyword: str, fmt: str) -> None:
+    async with full_exports:
+        rows = (row[1:] for row in db.iter_pl_by_name(keyword))
+        parts = export.export_parts(fields_, rows, fmt)
+        n = 0
+        try:
+            while True:
+                document = await asyncio.to_thread(next, parts, None)
+                if document is None:
+                    break
+                n += 1
+                await context.bot.send_document(
+                    chat_id=update.effective_user.id,
+                    document=document,
+                    filename=f'table-{keyword}-{n}.{fmt}'
+                )
+        except sqlite3.Error as e:
+            print(f'Error exporting {keyword}: {e}')
+            await send_internal_server_error_message(update, context)
+            return
+        except Exception:
+            parts.close()
+            raise
+
+    if n == 0:
+        await send(update, context, 'No record has been found.', False)
 
 
 # plot how a field is distributed
 async def plot(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    await register_user(update.effective_user.id)
+    register_user(update.effective_user.id)
 
     if await notify_user_if_updating(update, context):
         return
@@ -394,7 +479,7 @@ async def plot(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         await send(update, context, '*Value Error:* you need to specify a supported criteria (use /info plot to check them).', True)
         return
 
-    values = sorted(db.get_field_values(plot_supported[criteria]))
+    values = db.get_field_values(plot_supported[criteria])
     if values is None:
         await send_internal_server_error_message(update, context)
         return
@@ -402,38 +487,42 @@ async def plot(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         await send(update, context, 'There\'s not enough data to plot.', False)
         return
 
+    values.sort()
+    key = asset_key('plot', criteria, hashlib.sha1(repr(values).encode()).hexdigest())
+    if await send_known_photo(update, context, key):
+        return
+
     async with pngLock:
-        file = 'plot.png'
+        plt = research.pyplot()
+        buffer = BytesIO()
         plt.plot(values)
         plt.ylabel(criteria)
-        plt.savefig(file)
+        plt.savefig(buffer, format='png')
         plt.close()
 
-        await context.bot.send_photo(
-            chat_id=update.effective_user.id,
-            photo=open(file, 'rb')
-        )
-
-        os.remove(file)
+    await send_new_photo(update, context, key, buffer.getvalue())
 
 
 # returns the list of fields
 async def fields(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    await register_user(update.effective_user.id)
+    register_user(update.effective_user.id)
 
     if await notify_user_if_updating(update, context):
         return
 
-    string = ''
-    for key in fields_:
-        temp = fields_[key] if fields_[key][-1] != '~' else fields_[key][:-1]
-        string += f'_{temp}_\n'
+    messages = cached('fields')
+    if messages is None:
+        string = ''
+        for key in fields_:
+            temp = fields_[key] if fields_[key][-1] != '~' else fields_[key][:-1]
+            string += f'_{temp}_\n'
+        messages = remember('fields', None, ((string, True),))
 
-    await send(update, context, string, True)
+    await send_all(update, context, messages)
 
 
 async def locate(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    await register_user(update.effective_user.id)
+    register_user(update.effective_user.id)
 
     if await notify_user_if_updating(update, context):
         return
@@ -457,18 +546,17 @@ async def locate(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
             await send(update, context, 'There\'s not enough data to locate it.', False)
             return
 
+    caption = f'*Right ascension:* {rastr}, *Declination:* {decstr}'
+    key = asset_key('locate', rastr, decstr, constellation_[0])
+    if await send_known_photo(update, context, key, caption, 'Markdown'):
+        return
+
     buffer = await research.fetch_sky_image(coord, constellation_[0])
-    buffer.seek(0)
-    await context.bot.send_photo(
-        chat_id=update.effective_user.id,
-        photo=buffer.read(),
-        caption=f'*Right ascension:* {rastr}, *Declination:* {decstr}',
-        parse_mode='Markdown'
-    )
+    await send_new_photo(update, context, key, buffer.getvalue(), caption, 'Markdown')
 
 
 async def constellation(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    await register_user(update.effective_user.id)
+    register_user(update.effective_user.id)
 
     if await notify_user_if_updating(update, context):
         return
@@ -478,22 +566,25 @@ async def constellation(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         return
 
     name = ''.join(context.args).lower()
-    cst = db.get_constellation_by_celestial_body_name(name)
-    if cst == -1:
-        await send_internal_server_error_message(update, context)
-        return
-    elif cst is None:
-        await send(update, context, 'Celestial body not found.', False)
-        return
-    elif cst[0] is None:
-        await send(update, context, f'Celestial body was found, but currently unable to locate it.', False)
-        return
+    messages = cached('cst', name)
+    if messages is None:
+        cst = db.get_constellation_by_celestial_body_name(name)
+        if cst == -1:
+            await send_internal_server_error_message(update, context)
+            return
+        elif cst is None:
+            messages = (('Celestial body not found.', False),)
+        elif cst[0] is None:
+            messages = (('Celestial body was found, but currently unable to locate it.', False),)
+        else:
+            messages = ((f'The celestial body is located in *{cst[0]}* Constellation.', True),)
+        remember('cst', name, messages)
 
-    await send(update, context, f'The celestial body is located in *{cst[0]}* Constellation.', True)
+    await send_all(update, context, messages)
 
 
 async def rand(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    await register_user(update.effective_user.id)
+    register_user(update.effective_user.id)
 
     if await notify_user_if_updating(update, context):
         return
@@ -526,7 +617,7 @@ async def rand(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
 
 async def distance_endpoint(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    await register_user(update.effective_user.id)
+    register_user(update.effective_user.id)
 
     if await notify_user_if_updating(update, context):
         return
@@ -536,30 +627,33 @@ async def distance_endpoint(update: Update, context: ContextTypes.DEFAULT_TYPE)
         return
 
     command_called = update.message.text
-    if command_called == '/near':
-        top3 = db.get_nearest_planets()
-    else:
-        top3 = db.get_farthest_planets()
+    messages = cached('distance', command_called)
+    if messages is None:
+        if command_called == '/near':
+            top3 = db.get_nearest_planets()
+        else:
+            top3 = db.get_farthest_planets()
 
-    if top3 is None:
-        await send_internal_server_error_message(update, context)
-        return
-    elif not top3:
-        await send(update, context, 'We\'re currently unable to get the data needed. Please try again later.', False)
-        return
+        if top3 is None:
+            await send_internal_server_error_message(update, context)
+            return
+        elif not top3:
+            await send(update, context, 'We\'re currently unable to get the data needed. Please try again later.', False)
+            return
 
-    msg = f'*According to the data, the {'nearest' if command_called == '/near' else 'farthest'} planets are:*\n\n'
-    index = 1
-    for p in top3:
-        msg += f'*{index}.* {p[0]}, ~{p[1]} parsecs distant.\n'
-        index += 1
+        msg = f'*According to the data, the {'nearest' if command_called == '/near' else 'farthest'} planets are:*\n\n'
+        index = 1
+        for p in top3:
+            msg += f'*{index}.* {p[0]}, ~{p[1]} parsecs distant.\n'
+            index += 1
+        messages = remember('distance', command_called, ((msg, True),))
 
-    await send(update, context, msg, True)
+    await send_all(update, context, messages)
 
 
 # function that returns an image representing the planetary system
 async def show(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    await register_user(update.effective_user.id)
+    register_user(update.effective_user.id)
 
     if await notify_user_if_updating(update, context):
         return
@@ -580,34 +674,57 @@ async def show(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     name = ''.join(args).lower()
 
     celestial_body = db.get_celestial_body_info(name, is_planet)
-    if celestial_body is not None:
-        await asyncio.get_event_loop().run_in_executor(
-            executor, subprocess_queue.put, update.effective_user.id
-        )
-        if is_planet:
-            await img3d.run_blender_planet_script(update.effective_user.id, celestial_body)
-        else:
-            await img3d.run_blender_star_script(update.effective_user.id, celestial_body)
+    if celestial_body is None:
+        await send(update, context, 'Celestial body not found or unable to currently retrieve the data needed.', False)
+        return
     elif celestial_body == -1:
         await send_internal_server_error_message(update, context)
         return
-    else:
-        await send(update, context, 'Celestial body not found or unable to currently retrieve the data needed.', False)
+
+    caption = f'3d representation for the {"planet" if is_planet else "star"} \"{' '.join(args)}\".'
+    key = img3d.get_celestial_body_key(celestial_body, is_planet)
+    if await send_known_photo(update, context, key, caption):
         return
 
-    await asyncio.get_event_loop().run_in_executor(executor, subprocess_queue.get)
+    png = img3d.get_stored_render(celestial_body, is_planet)
+    if png is not None:
+        await send_new_photo(update, context, key, png, caption)
+        return
+
+    depth = img3d.queue_depth()
+    if depth > 0:
+        await send(update, context, f'Your render has been queued, there are {depth} renders ahead of you.', False)
+
+    try:
+        preview = await img3d.render_celestial_body(update.effective_user.id, celestial_body, is_planet, img3d.PREVIEW)
+    except RenderLimitError:
+        await send(update, context, 'You already have a render in progress, please wait for it to finish.', False)
+        return
+    except Exception as e:
+        print(f'Error rendering celestial body: {e}')
+        await send_internal_server_error_message(update, context)
+        return
 
-    await context.bot.send_photo(
+    message = await context.bot.send_photo(
         chat_id=update.effective_user.id,
-        photo=open(f'{IMG_DIR}{update.effective_user.id}.png', 'rb'),
-        caption=f'3d representation for the {"planet" if is_planet else "star"} \"{' '.join(context.args)}\".'
+        photo=preview,
+        caption=caption + ' Rendering the full quality image...'
     )
 
-    await asyncio.get_event_loop().run_in_executor(executor, img3d.delete_render_png, update.effective_user.id)
+    try:
+        png = await img3d.render_celestial_body(update.effective_user.id, celestial_body, is_planet, img3d.FINAL)
+    except Exception as e:
+        print(f'Error rendering celestial body: {e}')
+        await message.edit_caption(caption=caption)
+        return
+
+    message = await message.edit_media(media=InputMediaPhoto(media=png, caption=caption))
+    if isinstance(message, Message):
+        file_ids.put(key, message.photo[-1].file_id)
 
 
 async def hab(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    await register_user(update.effective_user.id)
+    register_user(update.effective_user.id)
 
     if await notify_user_if_updating(update, context):
         return
@@ -625,6 +742,12 @@ async def hab(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         args = context.args
 
     planet = ''.join(args).lower()
+    # only the single planet report is cached, -m can be arbitrarily long
+    messages = None if multiple else cached('hab', planet)
+    if messages is not None:
+        await send_all(update, context, messages)
+        return
+
     h_info = db.get_habitability_info(planet, multiple)
     if h_info is None:
         await send(update, context, 'Planet not found or currently unable to retrieve the data needed.', False)
@@ -635,9 +758,8 @@ async def hab(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
     msg = research.calculate_habitability(h_info, multiple)
     if not multiple:
-        msg_chunks = [msg[i:i+4096] for i in range(0, len(msg), 4096)]
-        for chunk in msg_chunks:
-            await send(update, context, chunk, True)
+        messages = tuple((msg[i:i+4096], True) for i in range(0, len(msg), 4096))
+        await send_all(update, context, remember('hab', planet, messages))
         return
 
     for m in msg:
@@ -645,7 +767,7 @@ async def hab(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
 
 async def hab_zone(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    await register_user(update.effective_user.id)
+    register_user(update.effective_user.id)
 
     if await notify_user_if_updating(update, context):
         return
@@ -655,6 +777,11 @@ async def hab_zone(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         return
 
     name = ' '.join(context.args).lower()
+    messages = cached('habzone', name)
+    if messages is not None:
+        await send_all(update, context, messages)
+        return
+
     data = db.get_habitable_zone_data(''.join(context.args).lower())
     if data is None:
         await send(update, context, f'Star not found or currently unable to retrieve the data needed.', True)
@@ -670,11 +797,40 @@ async def hab_zone(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         return
 
     inner, outer = research.calculate_habitable_zone_edges(luminosity)
-    await send(update, context, f'The habitable zone for the star \'*{name}*\' falls approximately between *{inner}* and *{outer}*, measured in Astronomical Units.', True)
+    msg = f'The habitable zone for the star \'*{name}*\' falls approximately between *{inner}* and *{outer}*, measured in Astronomical Units.'
+    await send_all(update, context, remember('habzone', name, ((msg, True),)))
+
+
+# /profile on <target|all> [cpu|memory], /profile off [target], /profile
+# targets are command names and tap_sync, dumps go to profiling.PROFILE_DIR
+async def profile(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if update.effective_user.id not in admins:
+        await unknown_cmd(update, context)
+        return
+
+    args = context.args
+    if len(args) == 0:
+        await send(update, context, f'Profiling: {profiling.status()}.', False)
+        return
+
+    if args[0] == 'on' and len(args) in (2, 3):
+        mode = args[2] if len(args) == 3 else profiling.CPU
+        try:
+            profiling.enable(args[1], mode)
+        except ValueError:
+            await send(update, context, f'*Value Error:* mode must be {profiling.CPU} or {profiling.MEMORY}.', True)
+            return
+    elif args[0] == 'off' and len(args) in (1, 2):
+        profiling.disable(args[1] if len(args) == 2 else None)
+    else:
+        await send(update, context, '*Invalid Syntax:* /profile on <target> [cpu|memory] or /profile off [target].', True)
+        return
+
+    await send(update, context, f'Profiling: {profiling.status()}.', False)
 
 
 async def report(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    await register_user(update.effective_user.id)
+    register_user(update.effective_user.id)
 
     if len(context.args) < 5:
         await send(update, context, '*Invalid Syntax:* you need to write a message at least 5 words long.', True)
@@ -687,28 +843,38 @@ async def report(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
 
 # inline query to retrieve information about database fields meaning
+async def get_inline_index() -> inlineindex.InlineIndex:
+    global inline_index
+    generation = updater.generation.number
+    async with inline_index_lock:
+        if inline_index is None or inline_index.generation != generation:
+            planets, hosts = await asyncio.to_thread(db.get_index_names)
+            index = inlineindex.InlineIndex(generation)
+            inline_index = await asyncio.to_thread(index.build, definitions, planets or (), hosts or ())
+    return inline_index
+
+
 async def inline_query(update: Update, context: CallbackContext) -> None:
-    await register_user(update.effective_user.id)
+    register_user(update.effective_user.id)
 
     query = update.inline_query.query
     if not query:
         return
 
-    matches = [val for val in definitions if query.lower() in val.lower()]
-
-    results = [
-        InlineQueryResultArticle(
-            id=str(uuid.uuid4()),
-            title=key,
-            input_message_content=InputTextMessageContent(definitions[key])
-        ) for key in matches
-    ]
-    await update.inline_query.answer(results)
+    offset = int(update.inline_query.offset) if update.inline_query.offset.isdigit() else 0
+    index = await get_inline_index()
+    results, next_offset = index.page(query, offset)
+    await update.inline_query.answer(
+        results,
+        cache_time=inlineindex.CACHE_TIME,
+        is_personal=False,
+        next_offset=next_offset
+    )
 
 
 # lets user subscribe to receive news
 async def subscribe(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    await register_user(update.effective_user.id)
+    register_user(update.effective_user.id)
 
     if await notify_user_if_updating(update, context):
         return
@@ -725,33 +891,19 @@ async def subscribe(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         await send(update, context, '*Value Error:* specified time doesn\'t match the required format.', True)
         return
 
-    subs = await asyncio.get_event_loop().run_in_executor(executor, read_subs)
-    if subs is None:
-        await send_internal_server_error_message(update, context)
-        return
-
-    already_sub = False
-    for i in range(len(subs)):
-        if subs[i].strip().split('-')[0] == str(id):
-            subs[i] = f'{id}-{time}\n'
-            already_sub = True
-            break
-
-    if not already_sub:
-        subs.append(f'{id}-{time}')
-
-    write = await asyncio.get_event_loop().run_in_executor(executor, write_subs, subs)
-    if not write:
+    minute = mythreads.NewsScheduler.to_minute(time)
+    if not sdb.subscribe(id, minute):
         await send_internal_server_error_message(update, context)
         return
 
+    news_scheduler.add(id, minute)
     msg = 'Your subscription was processed correctly.'
     await send(update, context, msg, False)
 
 
 # lets user unsubscribe
 async def unsubscribe(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    await register_user(update.effective_user.id)
+    register_user(update.effective_user.id)
 
     if await notify_user_if_updating(update, context):
         return
@@ -761,21 +913,15 @@ async def unsubscribe(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
         return
 
     id = update.effective_user.id
-    subs = await asyncio.get_event_loop().run_in_executor(executor, read_subs)
-    if subs is None:
-        await send_internal_server_error_message(update, context)
-        return
-
-    orig_len = len(subs)
-    filtered = [sub for sub in subs if sub.strip().split('-')[0] != str(id)]
-
-    write = await asyncio.get_event_loop().run_in_executor(executor, write_subs, filtered)
-    if not write:
+    removed = sdb.unsubscribe(id)
+    if removed is None:
         await send_internal_server_error_message(update, context)
         return
 
+    news_scheduler.remove(id)
+    news.pool.forget(id)
     msg = 'Your unsubscription was processed correctly.'
-    if len(filtered) == orig_len:
+    if removed == 0:
         msg = 'You\'re not subscribed.'
 
     await send(update, context, msg, False)
@@ -783,31 +929,11 @@ async def unsubscribe(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
 
 # stock message for unknown commands
 async def unknown_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    await register_user(update.effective_user.id)
+    register_user(update.effective_user.id)
     print(update.effective_chat.id)
     print(update.effective_user.id)
     await update.message.reply_text('Command not found.')
 
-# __________________________COMMAND HANDLERS__________________________________
-
-# I put these handlers in order to let the user run a command while he executed
-# one of these, since they're the ones that takes a bit much to return a result.
-# asyncio.create_task seems the only solutions to make it possible.
-
-'''
-async def locate_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    asyncio.create_task(locate(update, context))
-
-async def show_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    asyncio.create_task(show(update, context))
-
-async def table_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    asyncio.create_task(table(update, context))
-
-async def plot_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    asyncio.create_task(plot(update, context))
-'''
-
 # _______________________________BOT SETUP____________________________________
 
 def _read_token() -> str:
@@ -829,6 +955,23 @@ def _load_definitions():
             definitions[pair[0]] = pair[1]
 
 
+def _load_admins():
+    try:
+        with open(ADMINS_PATH, 'r') as file:
+            for line in file:
+                if line.strip():
+                    admins.add(int(line.strip()))
+    except (IOError, ValueError):
+        # no admin, no /profile
+        pass
+
+
+# every handler goes through here: latency metrics, and profiling when it's
+# been switched on for it
+def handler(name: str, callback):
+    return metrics.instrument(name, profiling.wrap(name, callback))
+
+
 def _load_infos():
     with open(INFO_PATH, 'r') as file:
         for line in file:
@@ -836,51 +979,188 @@ def _load_infos():
             comm_infos[pair[0]] = pair[1]
 
 
-def run() -> None:
-    global updater
+def _register_metrics(broadcaster: Broadcaster, processor):
+    metrics.callback('lexarchive_render_queue_depth', 'Renders waiting for a Blender worker.', img3d.scheduler.depth)
+    metrics.callback('lexarchive_render_running', 'Renders in progress.', lambda: img3d.scheduler.stats()['running'])
+    metrics.callback('lexarchive_render_wait_avg_seconds', 'Average queue wait of the latest renders.', lambda: img3d.scheduler.stats()['avg_wait'])
+    metrics.callback('lexarchive_render_wait_max_seconds', 'Longest queue wait of the latest renders.', lambda: img3d.scheduler.stats()['max_wait'])
+    metrics.callback('lexarchive_sessions', 'Chats with a live session.', lambda: len(sessions))
+    metrics.callback('lexarchive_archive_generation', 'Archive generation commands are served from.', lambda: updater.generation.number)
+    metrics.callback('lexarchive_archive_updating', '1 while the archive is being updated.', lambda: int(updater.generation.updating))
+    metrics.callback('lexarchive_response_cache_entries', 'Replies in the response cache.', lambda: len(response_cache))
+    metrics.callback('lexarchive_response_cache_hits_total', 'Response cache hits.', lambda: response_cache.stats()['hits'], 'counter')
+    metrics.callback('lexarchive_response_cache_misses_total', 'Response cache misses.', lambda: response_cache.stats()['misses'], 'counter')
+    metrics.callback('lexarchive_file_id_hits_total', 'Pictures sent by file_id.', lambda: file_ids.hits, 'counter')
+    metrics.callback('lexarchive_file_id_misses_total', 'Pictures uploaded.', lambda: file_ids.misses, 'counter')
+    metrics.callback('lexarchive_broadcast_sent_total', 'Broadcast messages delivered.', lambda: broadcaster.stats()['sent'], 'counter')
+    metrics.callback('lexarchive_broadcast_failed_total', 'Broadcast messages given up on.', lambda: broadcaster.stats()['failed'], 'counter')
+    if isinstance(processor, ChatOrderedProcessor):
+        metrics.callback('lexarchive_updates_running', 'Updates being handled.', lambda: processor.stats()['running'])
+        metrics.callback('lexarchive_updates_pending', 'Updates waiting for their chat or for a free slot.', lambda: processor.stats()['pending'])
+
+
+# without it PTB only logs that no error handler is registered
+async def _on_error(update, context) -> None:
+    update_id = update.update_id if isinstance(update, Update) else None
+    logging.getLogger(__name__).error(f'Error handling update {update_id}', exc_info=context.error)
+
 
+def _prune_file_ids(generation) -> None:
+    if not generation.updating:
+        file_ids.prune()
+
+
+async def warm_up() -> None:
+    try:
+        await asyncio.to_thread(db.db.connect)
+    except (sqlite3.Error, IOError) as e:
+        print(f'Unable to open the archive: {e}')
+    elapsed = await asyncio.to_thread(research.warm_up)
+    print(f'Warm-up done in {elapsed:.1f}s.')
+
+
+# a background task ending on its own is a bug, say so instead of losing it
+def _on_task_done(task) -> None:
+    background_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logging.getLogger(__name__).error(f'Background task {task.get_name()} died', exc_info=task.exception())
+
+
+def _start_background(coroutine) -> None:
+    task = asyncio.create_task(coroutine, name=coroutine.__qualname__)
+    background_tasks.add(task)
+    task.add_done_callback(_on_task_done)
+
+
+# spawns the Blender workers now rather than on the first /show
+async def start_renderer() -> None:
+    try:
+        await img3d.pool.start()
+    except Exception as e:
+        print(f'Unable to start the Blender workers: {e}')
+
+
+async def _post_init(application) -> None:
+    global metrics_server
+    metrics_server = HttpServer(metrics.handle, port=METRICS_PORT)
+    try:
+        await metrics_server.start()
+    except OSError as e:
+        print(f'Unable to start the metrics endpoint: {e}')
+        metrics_server = None
+
+    # kill -USR1 <pid> switches CPU profiling of everything on or off, -USR2 memory
+    if hasattr(signal, 'SIGUSR1'):
+        loop = asyncio.get_running_loop()
+        loop.add_signal_handler(signal.SIGUSR1, profiling.toggle, profiling.CPU)
+        loop.add_signal_handler(signal.SIGUSR2, profiling.toggle, profiling.MEMORY)
+
+    news.pool.load()
+    news_fetcher = mythreads.NewsFetcher(news.pool)
+    _start_background(news_fetcher.run())
+    _start_background(news_scheduler.run())
+    _start_background(updater.run())
+    _start_background(start_renderer())
+    if WARM_UP:
+        _start_background(warm_up())
+
+
+async def _shutdown(application) -> None:
+    tasks = list(background_tasks)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await img3d.scheduler.close()
+    await img3d.pool.close()
+    await asyncio.to_thread(sessions.snapshot)
+    if metrics_server is not None:
+        await metrics_server.close()
+
+
+# the real handler set, on its own so that benchmarks (src/bench/loadtest.py)
+# can build it against a fake Bot API through base_url
+def build_application(token: str, base_url=None, post_init=None, post_shutdown=None, update_queue=None,
+                      concurrent_updates=CONCURRENT_UPDATES):
     _load_fields()
     _load_definitions()
     _load_infos()
+    _load_admins()
+
+    builder = ApplicationBuilder().token(token)
+    if base_url is not None:
+        builder = builder.base_url(base_url)
+    if post_init is not None:
+        builder = builder.post_init(post_init)
+    if post_shutdown is not None:
+        builder = builder.post_shutdown(post_shutdown)
+    if update_queue is not None:
+        builder = builder.update_queue(update_queue)
+    # 1 keeps PTB's default: one update at a time, in order. A bounded queue
+    # (the webhook's queue_size) also bounds the updates admitted at once.
+    if concurrent_updates > 1:
+        if update_queue is not None and update_queue.maxsize > 0:
+            processor = ChatOrderedProcessor(concurrent_updates, update_queue.maxsize)
+        else:
+            processor = ChatOrderedProcessor(concurrent_updates)
+        builder = builder.concurrent_updates(processor)
+    application = builder.build()
+
+    application.add_handler(CommandHandler('start', handler('start', start)))
+    application.add_handler(CommandHandler('help', handler('help', help)))
+    application.add_handler(CommandHandler('info', handler('info', info)))
+    application.add_handler(CommandHandler('count', handler('count', count)))
+    application.add_handler(CommandHandler('pcount', handler('pcount', count)))
+    application.add_handler(CommandHandler('discin', handler('discin', disc_in)))
+    application.add_handler(CommandHandler('search', handler('search', search)))
+    application.add_handler(CommandHandler('table', handler('table', table)))
+    application.add_handler(CommandHandler('plot', handler('plot', plot)))
+    application.add_handler(CommandHandler('fields', handler('fields', fields)))
+    application.add_handler(CommandHandler('cst', handler('cst', constellation)))
+    application.add_handler(CommandHandler('locate', handler('locate', locate)))
+    application.add_handler(CommandHandler('random', handler('random', rand)))
+    application.add_handler(CommandHandler('near', handler('near', distance_endpoint)))
+    application.add_handler(CommandHandler('far', handler('far', distance_endpoint)))
+    application.add_handler(CommandHandler('show', handler('show', show)))
+    application.add_handler(CommandHandler('hab', handler('hab', hab)))
+    application.add_handler(CommandHandler('habzone', handler('habzone', hab_zone)))
+    application.add_handler(CommandHandler('report', handler('report', report)))
+    application.add_handler(CommandHandler('sub', handler('sub', subscribe)))
+    application.add_handler(CommandHandler('unsub', handler('unsub', unsubscribe)))
+    application.add_handler(CommandHandler('profile', handler('profile', profile)))
+    application.add_handler(MessageHandler(filters.COMMAND, handler('unknown', unknown_cmd)))
+    application.add_handler(CallbackQueryHandler(handler('button', button_listener)))
+    application.add_handler(InlineQueryHandler(handler('inline', inline_query)))
+    application.add_error_handler(_on_error)
+
+    broadcaster = Broadcaster(application.bot)
+    updater.set_broadcaster(broadcaster)
+    updater.set_sessions(sessions)
+    _register_metrics(broadcaster, application.update_processor)
+    return application
+
+
+def run() -> None:
+    global news_scheduler
 
     token = _read_token()
-    application = ApplicationBuilder().token(token).build()
-    application.add_handler(CommandHandler('start', start))
-    application.add_handler(CommandHandler('help', help))
-    application.add_handler(CommandHandler('info', info))
-    application.add_handler(CommandHandler('count', count))
-    application.add_handler(CommandHandler('pcount', count))
-    application.add_handler(CommandHandler('discin', disc_in))
-    application.add_handler(CommandHandler('search', search))
-    application.add_handler(CommandHandler('table', table))
-    application.add_handler(CommandHandler('plot', plot))
-    application.add_handler(CommandHandler('fields', fields))
-    application.add_handler(CommandHandler('cst', constellation))
-    application.add_handler(CommandHandler('locate', locate))
-    application.add_handler(CommandHandler('random', rand))
-    application.add_handler(CommandHandler('near', distance_endpoint))
-    application.add_handler(CommandHandler('far', distance_endpoint))
-    application.add_handler(CommandHandler('show', show))
-    application.add_handler(CommandHandler('hab', hab))
-    application.add_handler(CommandHandler('habzone', hab_zone))
-    application.add_handler(CommandHandler('report', report))
-    application.add_handler(CommandHandler('sub', subscribe))
-    application.add_handler(CommandHandler('unsub', unsubscribe))
-    application.add_handler(MessageHandler(filters.COMMAND, unknown_cmd))
-    application.add_handler(CallbackQueryHandler(button_listener))
-    application.add_handler(InlineQueryHandler(inline_query))
-
-    updater.set_bot(application.bot)
-    updater.set_ids(list(search_data.keys()))
-    updater.set_sleep_lock(state_lock)
-    updater.set_ids_lock(updater_ids_lock)
-    news_scheduler = mythreads.NewsScheduler(application.bot, subLock, newsLock)
-    news_fetcher = mythreads.NewsFetcher(newsLock)
-    updater.daemon = True
-    news_fetcher.daemon = True
-    news_scheduler.daemon = True
-    updater.start()
-    news_scheduler.start()
-    news_fetcher.start()
-
-    application.run_polling()
+    # webhook mode only when resources/config/webhook.txt is there, worker
+    # processes only when resources/config/workers.txt asks for more than one
+    config = webhook.read_config()
+    count = workers.read_count()
+    queue = asyncio.Queue(config['queue_size']) if config is not None else None
+    application = build_application(token, post_init=_post_init, post_shutdown=_shutdown, update_queue=queue)
+    sessions.load()
+    file_ids.load()
+    file_ids.prune()
+    updater.add_listener(_prune_file_ids)
+    sdb.import_text()
+    news_scheduler = mythreads.NewsScheduler(updater.broadcaster)
+    news_scheduler.load()
+
+    if count > 1:
+        asyncio.run(workers.serve(application, token, count, updater, sessions, config,
+                                  news_scheduler=news_scheduler))
+    elif config is not None:
+        asyncio.run(webhook.serve(application, config))
+    else:
+        application.run_polling()
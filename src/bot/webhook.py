@@ -0,0 +1,167 @@
+import asyncio
+import hmac
+import json
+import secrets
+import signal
+from aiohttp import web
+from telegram import Update
+from src.utils.dispatcher import ChatOrderedProcessor
+
+CONFIG_PATH = 'resources/config/webhook.txt'
+QUEUE_SIZE = 1000
+PUT_TIMEOUT = 2.0
+MAX_BODY = 1024 * 1024
+READ_TIMEOUT = 10
+SECRET_HEADER = 'x-telegram-bot-api-secret-token'
+
+
+# optional 'key=value' file: url (public address Telegram posts to, required),
+# listen, port, path, secret, queue_size, max_connections. Without it the bot
+# uses long polling.
+def read_config(path=CONFIG_PATH):
+    config = {}
+    try:
+        with open(path, 'r') as file:
+            for line in file:
+                if line.strip() and not line.startswith('#'):
+                    key, value = line.strip().split('=', 1)
+                    config[key.strip()] = value.strip()
+    except FileNotFoundError:
+        return None
+    except (IOError, ValueError) as e:
+        print(f'Error reading webhook config: {e}')
+        return None
+
+    if 'url' not in config:
+        print('Webhook config without url, falling back to polling.')
+        return None
+    return {
+        'url': config['url'],
+        'listen': config.get('listen', '127.0.0.1'),
+        'port': int(config.get('port', 8443)),
+        'path': config.get('path', '/telegram'),
+        'secret': config.get('secret') or secrets.token_urlsafe(32),
+        'queue_size': int(config.get('queue_size', QUEUE_SIZE)),
+        'max_connections': int(config.get('max_connections', 40))
+    }
+
+
+# receives the updates Telegram posts, on an aiohttp server, and feeds them
+# to the application's update queue. When handlers fall behind, a request
+# waits up to PUT_TIMEOUT and then gets a 503, so Telegram keeps the update
+# and retries later instead of the bot buffering without limit. The wait is
+# for a slot of gate (a ChatOrderedProcessor, see admit()) when given, since
+# PTB empties the queue into tasks right away, otherwise for room in the
+# bounded queue, which is enough when something else drains it at its own
+# pace (src/bot/workers.py). aiohttp answers wrong paths, methods and
+# oversized bodies; a body taking longer than READ_TIMEOUT to arrive gets a
+# 408.
+class WebhookReceiver:
+
+    def __init__(self, application, path: str, secret: str, listen='127.0.0.1', port=8443, gate=None):
+        self._application = application
+        self._gate = gate
+        self._path = path
+        self._secret = secret.encode()
+        self._listen = listen
+        self._port = port
+        self._runner = None
+        self.received = 0
+        self.rejected = 0
+
+    @property
+    def port(self) -> int:
+        return self._runner.addresses[0][1] if self._runner is not None else self._port
+
+    async def start(self):
+        app = web.Application(client_max_size=MAX_BODY)
+        app.router.add_post(self._path, self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self._listen, self._port).start()
+
+    async def close(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        secret = request.headers.get(SECRET_HEADER, '').encode()
+        if not hmac.compare_digest(secret, self._secret):
+            return web.Response(status=403)
+
+        try:
+            body = await asyncio.wait_for(request.read(), READ_TIMEOUT)
+        except asyncio.TimeoutError:
+            return web.Response(status=408)
+        try:
+            update = Update.de_json(json.loads(body), self._application.bot)
+        except (ValueError, TypeError, KeyError) as e:
+            print(f'Error decoding webhook update: {e}')
+            return web.Response(status=400)
+
+        if self._gate is not None and not await self._gate.admit(update, PUT_TIMEOUT):
+            self.rejected += 1
+            return web.Response(status=503)
+        try:
+            await asyncio.wait_for(self._application.update_queue.put(update), PUT_TIMEOUT)
+        except asyncio.TimeoutError:
+            if self._gate is not None:
+                self._gate.release(update)
+            self.rejected += 1
+            return web.Response(status=503)
+        self.received += 1
+        return web.Response()
+
+
+def _gate(application):
+    processor = application.update_processor
+    return processor if isinstance(processor, ChatOrderedProcessor) else None
+
+
+async def register(bot, config: dict, port: int):
+    await bot.set_webhook(
+        url=config['url'].rstrip('/') + config['path'],
+        secret_token=config['secret'],
+        max_connections=config['max_connections'],
+        allowed_updates=Update.ALL_TYPES
+    )
+    print(f'Webhook listening on {config["listen"]}:{port}{config["path"]}.')
+
+
+# event set by SIGINT/SIGTERM, where the loop supports signal handlers
+def stop_on_signals(stop=None) -> asyncio.Event:
+    stop = stop if stop is not None else asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+    return stop
+
+
+# runs the application until SIGINT/SIGTERM (or until stop is set). On the
+# way out the receiver stops accepting first, then the updates already queued
+# are handled before the application stops. The webhook stays registered, so
+# Telegram holds new updates until the next start.
+async def serve(application, config: dict, stop=None):
+    stop = stop_on_signals(stop)
+    path = config['path']
+    receiver = WebhookReceiver(application, path, config['secret'], config['listen'], config['port'],
+                               _gate(application))
+    await application.initialize()
+    try:
+        if application.post_init is not None:
+            await application.post_init(application)
+        await application.start()
+        await receiver.start()
+        await register(application.bot, config, receiver.port)
+        await stop.wait()
+    finally:
+        await receiver.close()
+        if application.running:
+            await application.stop()
+        if application.post_shutdown is not None:
+            await application.post_shutdown(application)
+        await application.shutdown()
@@ -0,0 +1,376 @@
+import asyncio
+import itertools
+import multiprocessing
+import os
+import queue
+import signal
+import time
+from telegram import Update
+from src.bot import webhook
+from src.datamanagement.database import DbManager as db
+from src.utils import img3d, metrics
+from src.utils.blenderpool import RenderError
+from src.utils.dispatcher import chat_key, MAX_PENDING
+from src.utils.renderscheduler import RenderLimitError, RenderTimeoutError, SchedulerClosedError
+
+WORKERS_PATH = 'resources/config/workers.txt'
+INBOX_SIZE = 1000
+JOIN_TIMEOUT = 30
+METRICS_INTERVAL = 15
+# render failures a worker's handlers tell apart, the others arrive as Exception
+RENDER_ERRORS = {error.__name__: error for error in (RenderLimitError, RenderTimeoutError, SchedulerClosedError,
+                                                    RenderError)}
+
+
+# optional file holding the number of worker processes; missing, or 1, means
+# everything runs in a single process
+def read_count(path=WORKERS_PATH) -> int:
+    try:
+        with open(path, 'r') as file:
+            return int(file.readline().strip())
+    except FileNotFoundError:
+        return 0
+    except (IOError, ValueError) as e:
+        print(f'Error reading the number of workers: {e}')
+        return 0
+
+
+# worker processes, each with an inbox of its own. Every update of a chat
+# goes to the same worker (chat id modulo the number of workers), so the
+# per-chat ordering and the chat's session stay inside one process. Messages
+# are ('update', dict), ('generation', tuple) or None to stop. The other way
+# round, the workers share an outbox read by the parent, which owns the news
+# scheduler and the only render scheduler and Blender pool:
+# ('subscribe', chat_id, minute), ('unsubscribe', chat_id),
+# ('render', index, request_id, user, data, is_planet, tier), answered on the
+# worker's replies queue, and ('metrics', index, snapshot), merged into the
+# parent's /metrics. A restarted worker starts its counters from zero again,
+# which Prometheus reads as a counter reset.
+class WorkerPool:
+
+    def __init__(self, token: str, count: int, base_url=None, setup=None, report=False, news_scheduler=None):
+        # spawn rather than fork: the parent runs an event loop and threads
+        self._context = multiprocessing.get_context('spawn')
+        self._token = token
+        self._base_url = base_url
+        self._setup = setup
+        self._inboxes = [self._context.Queue(INBOX_SIZE) for _ in range(count)]
+        self._outbox = self._context.Queue()
+        self._replies = [self._context.Queue() for _ in range(count)]
+        self._news_scheduler = news_scheduler
+        self._listener = None
+        self._renders = set()
+        self._processes = [None] * count
+        self._next = 0
+        self._sending = set()
+        # (update_id, seconds) for every update handled, for benchmarks
+        self.results = self._context.Queue() if report else None
+        self.routed = [0] * count
+        self.restarts = 0
+
+    def __len__(self):
+        return len(self._inboxes)
+
+    def start(self):
+        for index in range(len(self._inboxes)):
+            self._spawn(index)
+        self._listener = asyncio.get_running_loop().create_task(self._listen())
+
+    def _spawn(self, index: int):
+        process = self._context.Process(
+            target=run_worker,
+            args=(index, self._token, self._inboxes[index], self._outbox, self._replies[index], self._base_url,
+                  self._setup, self.results),
+            name=f'lexarchive-worker-{index}'
+        )
+        process.start()
+        self._processes[index] = process
+
+    def index(self, update) -> int:
+        key = chat_key(update)
+        if key is None:
+            self._next = (self._next + 1) % len(self._inboxes)
+            return self._next
+        return key % len(self._inboxes)
+
+    # a worker that died is started again, its inbox is still there
+    def _ensure(self, index: int):
+        if not self._processes[index].is_alive():
+            print(f'Worker {index} exited with code {self._processes[index].exitcode}, restarting it.')
+            self.restarts += 1
+            self._spawn(index)
+
+    async def _put(self, index: int, message):
+        try:
+            self._inboxes[index].put_nowait(message)
+        except queue.Full:
+            # the worker is behind: wait for room, which holds the router back
+            await asyncio.to_thread(self._inboxes[index].put, message)
+
+    async def dispatch(self, update: Update):
+        index = self.index(update)
+        self._ensure(index)
+        self.routed[index] += 1
+        await self._put(index, ('update', update.to_dict()))
+
+    async def _put_all(self, message):
+        for index in range(len(self._inboxes)):
+            await self._put(index, message)
+
+    # ArchiveUpdater listener: the workers only learn about the archive from here
+    def publish(self, generation):
+        task = asyncio.get_running_loop().create_task(self._put_all(('generation', tuple(generation))))
+        self._sending.add(task)
+        task.add_done_callback(self._sending.discard)
+
+    async def _listen(self):
+        while True:
+            message = await asyncio.to_thread(self._outbox.get)
+            if message is None:
+                return
+            try:
+                self._handle(message)
+            except Exception as e:
+                print(f'Error handling worker message {message[0]}: {e}')
+
+    def _handle(self, message):
+        kind = message[0]
+        if kind == 'subscribe':
+            if self._news_scheduler is not None:
+                self._news_scheduler.add(message[1], message[2])
+        elif kind == 'unsubscribe':
+            if self._news_scheduler is not None:
+                self._news_scheduler.remove(message[1])
+        elif kind == 'render':
+            task = asyncio.get_running_loop().create_task(self._render(*message[1:]))
+            self._renders.add(task)
+            task.add_done_callback(self._renders.discard)
+        elif kind == 'metrics':
+            metrics.merge(f'worker-{message[1]}', message[2])
+        else:
+            print(f'Unknown worker message {kind}.')
+
+    async def _render(self, index: int, request_id, user, data: dict, is_planet: bool, tier: str):
+        png, error = None, None
+        try:
+            png = await img3d.render_celestial_body(user, data, is_planet, tier)
+        except Exception as e:
+            error = (type(e).__name__, str(e))
+        self._replies[index].put((request_id, img3d.queue_depth(), png, error))
+
+    async def close(self):
+        await asyncio.gather(*self._sending, return_exceptions=True)
+        await self._put_all(None)
+        await asyncio.to_thread(self._join)
+        # the workers are gone, what they sent before exiting is in the outbox
+        if self._listener is not None:
+            self._outbox.put(None)
+            await self._listener
+        await asyncio.gather(*self._renders, return_exceptions=True)
+
+    def _join(self):
+        deadline = time.monotonic() + JOIN_TIMEOUT
+        for process in self._processes:
+            if process is None:
+                continue
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                print(f'{process.name} did not stop in time, terminating it.')
+                process.terminate()
+                process.join()
+
+
+# stands in for the news scheduler inside a worker: /sub and /unsub store the
+# subscription themselves, the parent's scheduler learns about it from here
+class SchedulerLink:
+
+    def __init__(self, outbox):
+        self._outbox = outbox
+
+    def add(self, chat_id, minute: int):
+        self._outbox.put(('subscribe', chat_id, minute))
+
+    def remove(self, chat_id):
+        self._outbox.put(('unsubscribe', chat_id))
+
+
+# img3d.remote inside a worker: renders are asked to the parent, so
+# concurrent requests for the same body share one render across workers and
+# the parent's limits hold for the whole bot. The queue depth is the one the
+# parent reported with its last answer.
+class RenderLink:
+
+    def __init__(self, index: int, outbox, replies):
+        self._index = index
+        self._outbox = outbox
+        self._replies = replies
+        # the replies queue outlives the process, the pid tells this worker's
+        # requests from those of the one it replaced
+        self._pid = os.getpid()
+        self._ids = itertools.count()
+        self._waiting = {}
+        self._depth = 0
+
+    async def render(self, user, data: dict, is_planet: bool, tier: str) -> bytes:
+        request_id = (self._pid, next(self._ids))
+        future = asyncio.get_running_loop().create_future()
+        self._waiting[request_id] = future
+        try:
+            self._outbox.put(('render', self._index, request_id, user, data, is_planet, tier))
+            return await future
+        finally:
+            del self._waiting[request_id]
+
+    def depth(self) -> int:
+        return self._depth
+
+    async def listen(self):
+        while True:
+            message = await asyncio.to_thread(self._replies.get)
+            if message is None:
+                return
+            request_id, self._depth, png, error = message
+            future = self._waiting.get(request_id)
+            if future is None or future.done():
+                continue
+            if error is None:
+                future.set_result(png)
+            else:
+                future.set_exception(RENDER_ERRORS.get(error[0], Exception)(error[1]))
+
+    def close(self):
+        self._replies.put(None)
+
+
+async def _report_metrics(index: int, outbox):
+    while True:
+        await asyncio.sleep(METRICS_INTERVAL)
+        outbox.put(('metrics', index, metrics.snapshot()))
+
+
+# entry point of a worker process: the bot's handlers, without the archive
+# updater, the news scheduler, the Blender pool or the metrics endpoint,
+# which stay in the parent. setup, if given, runs first (benchmarks use it
+# to stub things out).
+def run_worker(index: int, token: str, inbox, outbox, replies, base_url=None, setup=None, results=None):
+    # Ctrl-C reaches the whole process group, the parent decides when to stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    db.set_read_only()
+    if setup is not None:
+        setup()
+    asyncio.run(_work(index, token, inbox, outbox, replies, base_url, results))
+
+
+async def _work(index: int, token: str, inbox, outbox, replies, base_url, results):
+    from src.bot import tgbot
+    from src.utils import mythreads
+
+    tgbot.news_scheduler = SchedulerLink(outbox)
+    img3d.remote = RenderLink(index, outbox, replies)
+    application = tgbot.build_application(token, base_url=base_url)
+    tgbot.file_ids.load()
+    await application.initialize()
+    listener = asyncio.create_task(img3d.remote.listen())
+    reporter = asyncio.create_task(_report_metrics(index, outbox))
+    if tgbot.WARM_UP:
+        warm_up = asyncio.create_task(tgbot.warm_up())
+
+    processor = application.update_processor
+    pending = asyncio.Semaphore(MAX_PENDING)
+    tasks = set()
+
+    async def process(data: dict):
+        start = time.perf_counter()
+        try:
+            update = Update.de_json(data, application.bot)
+            await processor.process_update(update, application.process_update(update))
+        except Exception as e:
+            print(f'Worker {index}: error processing update {data.get("update_id")}: {e}')
+        finally:
+            pending.release()
+            if results is not None:
+                results.put((data.get('update_id'), time.perf_counter() - start))
+
+    try:
+        while True:
+            message = await asyncio.to_thread(inbox.get)
+            if message is None:
+                break
+            kind, payload = message
+            if kind == 'generation':
+                tgbot.updater.generation = mythreads.Generation(*payload)
+                continue
+            await pending.acquire()
+            task = asyncio.create_task(process(payload))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+    finally:
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if tgbot.WARM_UP:
+            await warm_up
+        img3d.remote.close()
+        await listener
+        reporter.cancel()
+        await asyncio.gather(reporter, return_exceptions=True)
+        outbox.put(('metrics', index, metrics.snapshot()))
+        await application.shutdown()
+
+
+async def _route(updates: asyncio.Queue, pool: WorkerPool, sessions):
+    while True:
+        update = await updates.get()
+        try:
+            # the parent keeps the sessions list, archive notices go to it
+            if update.effective_user is not None:
+                sessions.get(update.effective_user.id)
+            await pool.dispatch(update)
+        except Exception as e:
+            print(f'Error routing update {update.update_id}: {e}')
+        finally:
+            updates.task_done()
+
+
+# the parent: receives the updates (long polling, or the webhook when
+# webhook_config is given), routes them to the workers and runs the archive
+# updater and the news scheduler through the application's post_init. The
+# archive is opened here first, so its schema and WAL mode are in place
+# before the workers open it read-only.
+async def serve(application, token: str, count: int, updater, sessions, webhook_config=None, base_url=None,
+                stop=None, news_scheduler=None):
+    stop = webhook.stop_on_signals(stop)
+    await asyncio.to_thread(db.db.connect)
+
+    pool = WorkerPool(token, count, base_url, news_scheduler=news_scheduler)
+    pool.start()
+    updater.add_listener(pool.publish)
+    pool.publish(updater.generation)
+
+    receiver = None
+    router = None
+    await application.initialize()
+    try:
+        if application.post_init is not None:
+            await application.post_init(application)
+        router = asyncio.create_task(_route(application.update_queue, pool, sessions))
+        if webhook_config is not None:
+            receiver = webhook.WebhookReceiver(application, webhook_config['path'], webhook_config['secret'],
+                                               webhook_config['listen'], webhook_config['port'])
+            await receiver.start()
+            await webhook.register(application.bot, webhook_config, receiver.port)
+        else:
+            await application.updater.start_polling(allowed_updates=Update.ALL_TYPES)
+        print(f'Routing updates to {count} workers.')
+        await stop.wait()
+    finally:
+        if receiver is not None:
+            await receiver.close()
+        if application.updater.running:
+            await application.updater.stop()
+        # what was received is handed to the workers, which finish it
+        if router is not None:
+            await application.update_queue.join()
+            router.cancel()
+        await pool.close()
+        if application.post_shutdown is not None:
+            await application.post_shutdown(application)
+        await application.shutdown()
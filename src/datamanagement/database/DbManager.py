@@ -1,6 +1,7 @@
 import sqlite3
 import datetime
-from src.utils import research
+import threading
+from src.utils import research, metrics
 
 
 class Database:
@@ -21,22 +22,45 @@ class Database:
         self.DB = 'resources/archive/db.sqlite'
         self.conn = None
         self.cursor = None
-        self.__setup()
+        self.read_only = False
+        self._lock = threading.Lock()
+
+    # the archive is opened, and the schema replayed, by the first query
+    # rather than on import
+    def connect(self):
+        if self.conn is None:
+            with self._lock:
+                if self.conn is None:
+                    self.__setup()
+        return self.conn
 
     def __setup(self):
-        self.conn = sqlite3.connect(self.DB, check_same_thread=False)
-        self.cursor = self.conn.cursor()
+        if self.read_only:
+            conn = sqlite3.connect(f'file:{self.DB}?mode=ro', uri=True, check_same_thread=False)
+            self.cursor = conn.cursor()
+            self.conn = conn
+            return
+
+        conn = sqlite3.connect(self.DB, check_same_thread=False)
+        # WAL lets other processes read the archive while it's being updated
+        conn.execute('PRAGMA journal_mode=WAL')
+        cursor = conn.cursor()
         with open(self.DUMP, 'r') as file:
             statements = file.read().strip().split('~')
             for st in statements:
-                self.cursor.execute(st)
-        self.conn.commit()
+                cursor.execute(st)
+        conn.commit()
+        self.cursor = cursor
+        self.conn = conn
 
     def execute_query(self, query, params=None):
         if params is None:
             params = []
-        self.cursor.execute(query, params)
-        self.conn.commit()
+        if self.conn is None:
+            self.connect()
+        with metrics.db_query_seconds.time():
+            self.cursor.execute(query, params)
+            self.conn.commit()
         return self.cursor
 
     @staticmethod
@@ -48,10 +72,19 @@ class Database:
         return Database._TABLE_SIZES[table] if table in Database._TABLE_SIZES else -1
 
     def close(self):
-        self.conn.close()
+        if self.conn is not None:
+            self.conn.close()
 
 
 db = Database()
+CHUNK_SIZE = 500
+
+
+# for processes that only serve commands (src/bot/workers.py): the archive is
+# opened read-only and the schema is left to the process updating it. Must be
+# called before the first query.
+def set_read_only():
+    db.read_only = True
 
 
 def insert(table: str, row: list):
@@ -181,31 +214,41 @@ def count_like(keyword: str):
         return None
 
 
-def count_rows_per_pl(keyword: str):
-    try:
-        if keyword is None:
-            return count('ps')
-        else:
-            query = 'SELECT COUNT(id) FROM ps WHERE LOWER(REPLACE(pl_name, " ", "")) LIKE ?'
-            res = db.execute_query(query, [f'%{keyword}%'])
-            return res.fetchone()[0] if res else None
-    except sqlite3.Error as e:
-        print(f"An error occurred: {e}")
-        return None
-
-
 def get_pl_by_name(keyword: str):
     try:
-        query = f'SELECT * FROM ps WHERE LOWER(REPLACE(pl_name, " ", "")) LIKE ? LIMIT {Database.limit()}'
-        cres = True if count_rows_per_pl(keyword) >= Database.limit() else False
+        # one row past the limit tells whether there are more, without counting them
+        query = f'SELECT * FROM ps WHERE LOWER(REPLACE(pl_name, " ", "")) LIKE ? LIMIT {Database.limit() + 1}'
         res = db.execute_query(query, [f'%{keyword}%'])
         rows = [row for row in res.fetchall()] if res else []
-        return rows, cres
+        return rows[:Database.limit()], len(rows) > Database.limit()
     except sqlite3.Error as e:
         print(f"An error occurred: {e}")
         return None, None
 
 
+# a read-only connection for the caller alone. The shared cursor may only be
+# used from the event loop thread: code running in another thread reads
+# through one of these and closes it when done.
+def reader():
+    db.connect()
+    return sqlite3.connect(f'file:{db.DB}?mode=ro', uri=True, check_same_thread=False)
+
+
+# every matching ps row, fetched chunk_size at a time through a read-only
+# connection of its own, so a long export doesn't hold the shared cursor
+def iter_pl_by_name(keyword: str, chunk_size=CHUNK_SIZE):
+    conn = reader()
+    try:
+        cursor = conn.execute('SELECT * FROM ps WHERE LOWER(REPLACE(pl_name, " ", "")) LIKE ?', [f'%{keyword}%'])
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                return
+            yield from rows
+    finally:
+        conn.close()
+
+
 def get_field_values(keyword: str):
     try:
         query = f'SELECT {keyword} FROM pscomppars WHERE {keyword} != ""'
@@ -283,6 +326,21 @@ def get_names_set():
         return None
 
 
+# planet and host names for the inline index, through a connection of their
+# own: it's called from a worker thread, possibly while a sync is running
+def get_index_names():
+    conn = reader()
+    try:
+        planets = {row[0] for row in conn.execute('SELECT pl_name FROM pscomppars')}
+        hosts = {row[0] for row in conn.execute('SELECT DISTINCT hostname FROM pscomppars')}
+        return planets, hosts
+    except sqlite3.Error as e:
+        print(f"An error occurred: {e}")
+        return None, None
+    finally:
+        conn.close()
+
+
 def get_celestial_body_info(name: str, is_planet=True):
     try:
         fields = [
@@ -302,7 +360,8 @@ def get_celestial_body_info(name: str, is_planet=True):
         if not is_planet:
             fields = [
                 'hostname',
-                'st_spectype'
+                'st_spectype',
+                'st_teff'
             ]
             query = f'SELECT {','.join(fields)} FROM pscomppars WHERE LOWER(REPLACE(hostname, " ", "")) = ?'
 
@@ -317,6 +376,39 @@ def get_celestial_body_info(name: str, is_planet=True):
         return -1
 
 
+# through a connection of its own, it runs in a worker thread
+def get_render_data(is_planet=True, names=None):
+    try:
+        if is_planet:
+            fields = ['pl_name', 'pl_eqt', 'pl_bmasse', 'pl_rade', 'pl_orbsmax', 'st_teff']
+            query = f'SELECT {",".join(fields)} FROM pscomppars WHERE 1'
+        else:
+            # same row get_celestial_body_info would pick for the host
+            fields = ['hostname', 'st_spectype', 'st_teff']
+            query = (
+                f'SELECT {",".join(fields)} FROM pscomppars '
+                'WHERE id IN (SELECT MIN(id) FROM pscomppars GROUP BY hostname)'
+            )
+
+        params = []
+        if names is not None:
+            params = list(names)
+            placeholders = ','.join(['?'] * len(params))
+            if is_planet:
+                query += f' AND pl_name IN ({placeholders})'
+            else:
+                query += f' AND hostname IN (SELECT hostname FROM pscomppars WHERE pl_name IN ({placeholders}))'
+
+        conn = reader()
+        try:
+            return [{key: val for key, val in zip(fields, row)} for row in conn.execute(query, params)]
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        print(f"An error occurred: {e}")
+        return None
+
+
 def get_habitability_info(planet: str, multiple: bool):
     try:
         check_exist = exists(planet)
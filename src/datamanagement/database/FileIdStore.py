@@ -0,0 +1,111 @@
+import sqlite3
+import threading
+import time
+
+DAY = 86400
+
+
+# file_id Telegram returned for an already uploaded picture, keyed by a hash
+# of what the picture shows: when the data changes the key changes too, so a
+# stale file_id is never matched and simply ages out. Lookups are served from
+# memory, the table only makes the map survive restarts.
+class FileIdStore:
+    _STORE = 'resources/data/fileids.sqlite'
+    _MAX_AGE = 30 * DAY
+
+    def __init__(self, path=None):
+        self.STORE = path if path is not None else FileIdStore._STORE
+        self.conn = None
+        self._lock = threading.Lock()
+        self._ids = {}
+        self._used = {}
+        self.hits = 0
+        self.misses = 0
+
+    # the file is opened, and the table created, on first use
+    def connect(self):
+        if self.conn is None:
+            with self._lock:
+                if self.conn is None:
+                    self.__setup()
+        return self.conn
+
+    def __setup(self):
+        conn = sqlite3.connect(self.STORE, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS file_ids ('
+            'key TEXT PRIMARY KEY, '
+            'file_id TEXT NOT NULL, '
+            'used INTEGER NOT NULL) WITHOUT ROWID'
+        )
+        conn.commit()
+        self.conn = conn
+
+    def load(self):
+        try:
+            for key, file_id, used in self.connect().execute('SELECT key, file_id, used FROM file_ids'):
+                self._ids[key] = file_id
+                self._used[key] = used
+            return len(self._ids)
+        except sqlite3.Error as e:
+            print(f"An error occurred: {e}")
+            return -1
+
+    def get(self, key: str):
+        file_id = self._ids.get(key)
+        if file_id is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        # the last use is written at most once a day per key
+        today = int(time.time()) // DAY
+        if self._used[key] != today:
+            self._used[key] = today
+            self._execute('UPDATE file_ids SET used = ? WHERE key = ?', [today, key])
+        return file_id
+
+    def put(self, key: str, file_id: str):
+        today = int(time.time()) // DAY
+        self._ids[key] = file_id
+        self._used[key] = today
+        return self._execute('INSERT OR REPLACE INTO file_ids VALUES (?, ?, ?)', [key, file_id, today])
+
+    def forget(self, key: str):
+        self._ids.pop(key, None)
+        self._used.pop(key, None)
+        return self._execute('DELETE FROM file_ids WHERE key = ?', [key])
+
+    # drops the ids nobody asked for in max_age seconds
+    def prune(self, max_age=_MAX_AGE):
+        limit = (int(time.time()) - max_age) // DAY
+        stale = [key for key, used in self._used.items() if used < limit]
+        for key in stale:
+            del self._ids[key]
+            del self._used[key]
+        try:
+            conn = self.connect()
+            conn.execute('DELETE FROM file_ids WHERE used < ?', [limit])
+            conn.commit()
+            return len(stale)
+        except sqlite3.Error as e:
+            print(f"An error occurred: {e}")
+            return -1
+
+    def _execute(self, query, params):
+        try:
+            conn = self.connect()
+            conn.execute(query, params)
+            conn.commit()
+            return True
+        except sqlite3.Error as e:
+            print(f"An error occurred: {e}")
+            return False
+
+    def __len__(self):
+        return len(self._ids)
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
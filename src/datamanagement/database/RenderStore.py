@@ -0,0 +1,69 @@
+import sqlite3
+import threading
+
+
+class RenderStore:
+    _STORE = 'resources/archive/renders.sqlite'
+
+    def __init__(self, path=None):
+        self.STORE = path if path is not None else RenderStore._STORE
+        self.conn = None
+        self._lock = threading.Lock()
+
+    # the file is opened, and the table created, on first use
+    def connect(self):
+        if self.conn is None:
+            with self._lock:
+                if self.conn is None:
+                    self.__setup()
+        return self.conn
+
+    def __setup(self):
+        conn = sqlite3.connect(self.STORE, check_same_thread=False)
+        conn.execute('CREATE TABLE IF NOT EXISTS renders (key TEXT PRIMARY KEY, png BLOB) WITHOUT ROWID')
+        conn.commit()
+        self.conn = conn
+
+    def get(self, key: str):
+        try:
+            row = self.connect().execute('SELECT png FROM renders WHERE key = ?', [key]).fetchone()
+            return row[0] if row else None
+        except sqlite3.Error as e:
+            print(f"An error occurred: {e}")
+            return None
+
+    def keys(self) -> set:
+        try:
+            return {row[0] for row in self.connect().execute('SELECT key FROM renders')}
+        except sqlite3.Error as e:
+            print(f"An error occurred: {e}")
+            return set()
+
+    def put(self, key: str, png: bytes):
+        try:
+            conn = self.connect()
+            conn.execute('INSERT OR REPLACE INTO renders VALUES (?, ?)', [key, png])
+            conn.commit()
+            return True
+        except sqlite3.Error as e:
+            print(f"An error occurred: {e}")
+            return False
+
+    # drops every render that no celestial body points to anymore
+    def prune(self, keys: set):
+        try:
+            stale = self.keys() - keys
+            conn = self.connect()
+            conn.executemany('DELETE FROM renders WHERE key = ?', [[key] for key in stale])
+            conn.commit()
+            if stale:
+                conn.execute('VACUUM')
+            return len(stale)
+        except sqlite3.Error as e:
+            print(f"An error occurred: {e}")
+            return -1
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
@@ -0,0 +1,120 @@
+import os
+import sqlite3
+import threading
+
+
+class SubDatabase:
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            SubDatabase._instance = super(SubDatabase, cls).__new__(cls)
+        return SubDatabase._instance
+
+    def __init__(self):
+        self.DB = 'resources/data/subscribers.sqlite'
+        self.conn = None
+        self._lock = threading.Lock()
+
+    # the file is opened, and the schema created, by the first query
+    def connect(self):
+        if self.conn is None:
+            with self._lock:
+                if self.conn is None:
+                    self.__setup()
+        return self.conn
+
+    def __setup(self):
+        conn = sqlite3.connect(self.DB, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS subscriptions ('
+            'chat_id INTEGER PRIMARY KEY, '
+            'minute INTEGER NOT NULL)'
+        )
+        # the scheduler loads every subscription at once, nothing looks them up by minute
+        conn.execute('DROP INDEX IF EXISTS subscriptions_minute')
+        conn.commit()
+        self.conn = conn
+
+    def execute_query(self, query, params=None):
+        if params is None:
+            params = []
+        conn = self.connect()
+        cursor = conn.execute(query, params)
+        conn.commit()
+        return cursor
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+db = SubDatabase()
+TXT_PATH = 'resources/data/subscribers.txt'
+
+
+# minute is the delivery time as minutes from 00:00 UTC
+def subscribe(chat_id: int, minute: int):
+    try:
+        query = (
+            'INSERT INTO subscriptions VALUES (?, ?) '
+            'ON CONFLICT (chat_id) DO UPDATE SET minute = excluded.minute'
+        )
+        db.execute_query(query, [chat_id, minute])
+        return True
+    except sqlite3.Error as e:
+        print(f"An error occurred: {e}")
+        return False
+
+
+# number of removed subscriptions, 0 if the chat wasn't subscribed
+def unsubscribe(chat_id: int):
+    try:
+        res = db.execute_query('DELETE FROM subscriptions WHERE chat_id = ?', [chat_id])
+        return res.rowcount
+    except sqlite3.Error as e:
+        print(f"An error occurred: {e}")
+        return None
+
+
+def get_subscriptions():
+    try:
+        res = db.execute_query('SELECT chat_id, minute FROM subscriptions')
+        return res.fetchall()
+    except sqlite3.Error as e:
+        print(f"An error occurred: {e}")
+        return None
+
+
+# one-shot import of the old 'chat_id-HH:MM' text file, renamed once imported
+def import_text(path=TXT_PATH):
+    if not os.path.exists(path):
+        return 0
+
+    rows = []
+    try:
+        with open(path, 'r') as file:
+            for line in file:
+                if line.strip():
+                    chat_id, hhmm = line.strip().split('-')
+                    hours, minutes = hhmm.split(':')
+                    rows.append([int(chat_id), int(hours) * 60 + int(minutes)])
+    except (IOError, ValueError) as e:
+        print(f'Error reading subscription file: {e}')
+        return None
+
+    try:
+        conn = db.connect()
+        conn.executemany(
+            'INSERT INTO subscriptions VALUES (?, ?) '
+            'ON CONFLICT (chat_id) DO UPDATE SET minute = excluded.minute',
+            rows
+        )
+        conn.commit()
+        os.replace(path, path + '.imported')
+        return len(rows)
+    except (sqlite3.Error, OSError) as e:
+        print(f"An error occurred: {e}")
+        return None
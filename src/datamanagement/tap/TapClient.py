@@ -1,4 +1,3 @@
-import requests
 import csv
 import io
 import src.datamanagement.database.DbManager as db
@@ -59,12 +58,16 @@ def _check_names_list(tap_list, db_list):
 
 
 def update():
+    # only the daily sync needs it, not worth loading at startup
+    import requests
+
     pscomppars_count = db.count('pscomppars')
     count_query = 'select+count%28*%29+from+pscomppars&format=csv'
     count_response = requests.get(BASE_URL + count_query)
     tap_count = int(count_response.text.split('\n')[1])
     ps_count = db.count('ps')
     actually_updated = False
+    changed = []
 
     # get all table if it's empty
     if pscomppars_count == 0:
@@ -72,6 +75,7 @@ def update():
         response = requests.get(BASE_URL + query)
         for row in form_rows(response.text):
             db.insert('pscomppars', [None] + row + [None, None])
+            changed.append(row[0])
             actually_updated = True
 
     # if the counts don't match, the table only needs an update
@@ -87,6 +91,7 @@ def update():
             response = requests.get(BASE_URL + query)
             for row in form_rows(response.text):
                 db.insert('pscomppars', [None] + row + [None, None])
+                changed.append(row[0])
                 actually_updated = True
         if len(to_delete) > 0:
             for pl in to_delete:
@@ -123,3 +128,6 @@ def update():
     if actually_updated:
         db.set_current_date()
         print('updated')
+
+    # names of the pscomppars rows written by this update
+    return changed
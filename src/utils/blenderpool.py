@@ -0,0 +1,193 @@
+import asyncio
+
+
+BLENDER_PATH = '/opt/blender/blender'
+WORKER_FILE = 'resources/blender/worker_script.txt'
+MARKER = b'@@LEXARCHIVE@@'
+
+
+class RenderError(Exception):
+    pass
+
+
+class WorkerError(Exception):
+    pass
+
+
+# a single long-lived blender process: it compiles the scripts once at startup
+# and then renders one job at a time, reading requests from stdin and sending
+# back '<MARKER> <status> <length>' followed by the raw png bytes on stdout
+class BlenderWorker:
+
+    def __init__(self, command: list, cwd=None):
+        self._command = command
+        self._cwd = cwd
+        self._proc = None
+        self.jobs = 0
+
+    def _replace(self):
+        task = asyncio.create_task(self._refill())
+        self._spawning.add(task)
+        task.add_done_callback(self._spawning.discard)
+
+    async def _refill(self):
+        worker = None
+        try:
+            worker = await self._spawn()
+        except Exception as e:
+            print(f'Error starting a Blender worker: {e}')
+        finally:
+            self._slots.put_nowait(worker)
+
+    async def start(self):
+        self._proc = await asyncio.create_subprocess_exec(
+            *self._command,
+            cwd=self._cwd,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL
+        )
+        status, _ = await self._read_reply()
+        if status != b'ready':
+            raise WorkerError(f'Unexpected worker handshake: {status}')
+
+    def alive(self) -> bool:
+        return self._proc is not None and self._proc.returncode is None
+
+    async def _read_reply(self):
+        # blender writes its own logs on stdout, skip everything until the marker
+        while True:
+            line = await self._proc.stdout.readline()
+            if not line:
+                raise WorkerError('Worker exited unexpectedly.')
+            if line.startswith(MARKER):
+                break
+
+        header = line.split()
+        status = header[1]
+        length = int(header[2]) if len(header) > 2 else 0
+        payload = await self._proc.stdout.readexactly(length) if length > 0 else b''
+        return status, payload
+
+    async def render(self, script: str, args: list) -> bytes:
+        request = ' '.join([script] + [str(arg).replace(' ', '') for arg in args]) + '\n'
+        self._proc.stdin.write(request.encode())
+        await self._proc.stdin.drain()
+        status, payload = await self._read_reply()
+        self.jobs += 1
+        if status != b'ok':
+            raise RenderError(payload.decode(errors='replace'))
+        return payload
+
+    def kill(self):
+        if self.alive():
+            self._proc.kill()
+
+    async def close(self, timeout=10):
+        if not self.alive():
+            return
+        self._proc.stdin.close()
+        try:
+            await asyncio.wait_for(self._proc.wait(), timeout)
+        except asyncio.TimeoutError:
+            self._proc.kill()
+            await self._proc.wait()
+
+
+# fixed number of worker slots, each one holding a started worker or None when
+# it needs to be (re)spawned. start() fills every slot ahead of the first job,
+# otherwise workers are spawned lazily. They're killed when a job times out
+# and recycled after max_jobs renders to keep memory under control; the
+# replacement is started right away, so the next job doesn't wait for it.
+class BlenderPool:
+
+    def __init__(self, scripts: list, size=2, timeout=180, max_jobs=25, command=None, cwd=None):
+        self._scripts = scripts
+        self._size = size
+        self._timeout = timeout
+        self._max_jobs = max_jobs
+        self._command = command if command is not None else [BLENDER_PATH, '-b', '-P', WORKER_FILE, '--']
+        self._cwd = cwd
+        self._slots = asyncio.Queue()
+        self._closing = set()
+        self._spawning = set()
+        self._workers = set()
+        for _ in range(size):
+            self._slots.put_nowait(None)
+
+    def size(self) -> int:
+        return self._size
+
+    async def _spawn(self) -> BlenderWorker:
+        worker = BlenderWorker(self._command + self._scripts, self._cwd)
+        try:
+            await asyncio.wait_for(worker.start(), self._timeout)
+        except BaseException:
+            worker.kill()
+            raise
+        self._workers.add(worker)
+        return worker
+
+    def _retire(self, worker: BlenderWorker):
+        self._workers.discard(worker)
+        task = asyncio.create_task(worker.close())
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    def _replace(self):
+        task = asyncio.create_task(self._refill())
+        self._spawning.add(task)
+        task.add_done_callback(self._spawning.discard)
+
+    async def _refill(self):
+        worker = None
+        try:
+            worker = await self._spawn()
+        except Exception as e:
+            print(f'Error starting a Blender worker: {e}')
+        finally:
+            self._slots.put_nowait(worker)
+
+    async def start(self):
+        slots = [await self._slots.get() for _ in range(self._size)]
+        try:
+            for i in range(self._size):
+                if slots[i] is None:
+                    slots[i] = await self._spawn()
+        finally:
+            for worker in slots:
+                self._slots.put_nowait(worker)
+
+    async def render(self, script: str, args: list) -> bytes:
+        worker = await self._slots.get()
+        try:
+            if worker is None or not worker.alive():
+                worker = await self._spawn()
+            data = await asyncio.wait_for(worker.render(script, args), self._timeout)
+        except RenderError:
+            raise
+        except BaseException:
+            # timeouts, cancellations and broken pipes leave the worker in an
+            # unknown state, so it's killed and the slot gets a fresh one
+            if worker is not None:
+                worker.kill()
+                self._workers.discard(worker)
+            worker = None
+            raise
+        finally:
+            if worker is not None and worker.jobs >= self._max_jobs:
+                self._retire(worker)
+                self._replace()
+            else:
+                self._slots.put_nowait(worker)
+
+        return data
+
+    async def close(self):
+        for task in list(self._spawning):
+            task.cancel()
+        await asyncio.gather(*self._spawning, return_exceptions=True)
+        for worker in list(self._workers):
+            self._retire(worker)
+        if self._closing:
+            await asyncio.gather(*self._closing, return_exceptions=True)
@@ -0,0 +1,138 @@
+import asyncio
+import time
+from datetime import timedelta
+from telegram.error import TelegramError, RetryAfter, Forbidden, BadRequest, NetworkError, TimedOut
+
+GLOBAL_RATE = 25
+PER_CHAT_INTERVAL = 1.0
+CONCURRENCY = 16
+MAX_RETRIES = 3
+PROGRESS_EVERY = 1000
+
+
+class TokenBucket:
+
+    def __init__(self, rate: float, capacity=None):
+        self._rate = rate
+        self._capacity = capacity if capacity is not None else rate
+        self._tokens = self._capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    # stops handing out tokens for a while, used when the server says so
+    def pause(self, seconds: float):
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self._capacity, self._tokens + (now - self._updated) * self._rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self._rate)
+
+
+def _seconds(retry_after) -> float:
+    return retry_after.total_seconds() if isinstance(retry_after, timedelta) else float(retry_after)
+
+
+# sends the same kind of message to many chats without tripping Telegram's
+# flood limits: a shared token bucket for the global rate, a minimum interval
+# between two messages to the same chat and a bounded number of requests in
+# flight. A 429 pauses the whole bucket for the retry_after the server asks.
+class Broadcaster:
+
+    def __init__(self, bot, rate=GLOBAL_RATE, per_chat_interval=PER_CHAT_INTERVAL,
+                 concurrency=CONCURRENCY, max_retries=MAX_RETRIES):
+        self._bot = bot
+        self._bucket = TokenBucket(rate)
+        self._per_chat_interval = per_chat_interval
+        self._concurrency = concurrency
+        self._max_retries = max_retries
+        self._last_sent = {}
+        self._totals = {'sent': 0, 'failed': 0, 'retried': 0, 'broadcasts': 0}
+
+    async def _wait_for_chat(self, chat_id):
+        last = self._last_sent.get(chat_id)
+        if last is not None:
+            delay = last + self._per_chat_interval - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+    def _forget_old_chats(self):
+        limit = time.monotonic() - self._per_chat_interval
+        for chat_id in [chat_id for chat_id, last in self._last_sent.items() if last < limit]:
+            del self._last_sent[chat_id]
+
+    async def send(self, chat_id, text: str, report: dict) -> bool:
+        for attempt in range(self._max_retries + 1):
+            await self._wait_for_chat(chat_id)
+            await self._bucket.acquire()
+            self._last_sent[chat_id] = time.monotonic()
+            try:
+                await self._bot.send_message(chat_id=chat_id, text=text)
+                report['sent'] += 1
+                return True
+            except RetryAfter as e:
+                self._bucket.pause(_seconds(e.retry_after))
+            except (Forbidden, BadRequest):
+                # blocked the bot, deleted the chat... retrying won't help
+                break
+            except TimedOut:
+                # the request may have reached Telegram anyway: sending it
+                # again could deliver the notice twice
+                report['sent'] += 1
+                return True
+            except NetworkError:
+                await asyncio.sleep(2 ** attempt)
+            except TelegramError as e:
+                print(f'Error sending message to {chat_id}: {e}')
+                break
+            if attempt < self._max_retries:
+                report['retried'] += 1
+
+        report['failed'] += 1
+        return False
+
+    # text is either the message or a callable returning the message for a
+    # chat (None to skip it). progress, if given, is called with the report
+    # every PROGRESS_EVERY chats.
+    async def broadcast(self, chat_ids, text, progress=None) -> dict:
+        report = {'total': 0, 'sent': 0, 'failed': 0, 'retried': 0, 'skipped': 0}
+        start = time.monotonic()
+        chats = iter(chat_ids)
+
+        async def worker():
+            for chat_id in chats:
+                message = text(chat_id) if callable(text) else text
+                report['total'] += 1
+                if message is None:
+                    report['skipped'] += 1
+                else:
+                    await self.send(chat_id, message, report)
+                if report['total'] % PROGRESS_EVERY == 0:
+                    self._forget_old_chats()
+                    if progress is not None:
+                        progress(self._with_rate(report, start))
+
+        await asyncio.gather(*[worker() for _ in range(self._concurrency)])
+        self._forget_old_chats()
+        for key in ('sent', 'failed', 'retried'):
+            self._totals[key] += report[key]
+        self._totals['broadcasts'] += 1
+        return self._with_rate(report, start)
+
+    @staticmethod
+    def _with_rate(report: dict, start: float) -> dict:
+        elapsed = time.monotonic() - start
+        return dict(report, elapsed=elapsed, throughput=report['sent'] / elapsed if elapsed > 0 else 0.0)
+
+    def stats(self) -> dict:
+        return dict(self._totals)
@@ -0,0 +1,109 @@
+import asyncio
+from telegram.ext import BaseUpdateProcessor
+
+MAX_CONCURRENT = 32
+MAX_PENDING = 1024
+
+
+def chat_key(update):
+    chat = getattr(update, 'effective_chat', None)
+    if chat is not None:
+        return chat.id
+    # inline queries have no chat, the user is the next best thing
+    user = getattr(update, 'effective_user', None)
+    return user.id if user is not None else None
+
+
+# updates of different chats are handled in parallel, up to max_concurrent
+# at once; those of the same chat wait for each other, in the order they
+# arrived, so a chat's /search and its page buttons can't overtake each other.
+# A task waiting behind its chat doesn't take one of the max_concurrent slots,
+# so a chat sending a burst only delays itself.
+# PTB starts a task for every update as soon as it leaves the update queue,
+# max_pending only bounds how many of them are in do_process_update, the
+# others wait on PTB's semaphore. The intake is bounded by admit(): the
+# webhook takes a slot before queueing an update and the slot is given back
+# once the update is handled, so at most max_pending updates are in memory.
+class ChatOrderedProcessor(BaseUpdateProcessor):
+
+    def __init__(self, max_concurrent=MAX_CONCURRENT, max_pending=MAX_PENDING):
+        super().__init__(max(max_pending, max_concurrent))
+        self._limit = max_concurrent
+        self._slots = asyncio.Semaphore(max_concurrent)
+        self._intake = asyncio.Semaphore(max(max_pending, max_concurrent))
+        self._admitted = set()
+        # chat -> [lock, updates holding or waiting for it]
+        self._chats = {}
+        self.running = 0
+        self.processed = 0
+        self.errors = 0
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    # False when no slot frees up within timeout
+    async def admit(self, update, timeout: float) -> bool:
+        try:
+            await asyncio.wait_for(self._intake.acquire(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        self._admitted.add(update.update_id)
+        return True
+
+    def release(self, update):
+        update_id = getattr(update, 'update_id', None)
+        if update_id in self._admitted:
+            self._admitted.discard(update_id)
+            self._intake.release()
+
+    async def do_process_update(self, update, coroutine) -> None:
+        try:
+            await self._process(update, coroutine)
+        finally:
+            self.release(update)
+
+    async def _process(self, update, coroutine):
+        key = chat_key(update)
+        if key is None:
+            await self._run(coroutine)
+            return
+
+        entry = self._chats.get(key)
+        if entry is None:
+            entry = self._chats[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                await self._run(coroutine)
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._chats[key]
+
+    async def _run(self, coroutine):
+        async with self._slots:
+            self.running += 1
+            try:
+                await coroutine
+            except Exception as e:
+                # Application.process_update already hands handler errors to
+                # the error handlers, anything getting here is a bug of ours
+                self.errors += 1
+                print(f'Error processing update: {e}')
+            finally:
+                self.running -= 1
+                self.processed += 1
+
+    def stats(self) -> dict:
+        return {
+            'limit': self._limit,
+            'running': self.running,
+            'pending': self.current_concurrent_updates - self.running,
+            'admitted': len(self._admitted),
+            'chats': len(self._chats),
+            'processed': self.processed,
+            'errors': self.errors
+        }
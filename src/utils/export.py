@@ -0,0 +1,81 @@
+import csv
+import gzip
+import io
+import json
+from src.utils import text
+
+FORMATS = ('html', 'csv', 'csv.gz', 'jsonl')
+DEFAULT_FORMAT = 'html'
+# full exports are compressed while the rows are written, unless asked otherwise
+FULL_FORMAT = 'csv.gz'
+# Telegram refuses bot uploads over 50 MB, the margin covers what is still
+# buffered in the text and gzip layers when the size is checked
+PART_SIZE = 45 * 1024 * 1024
+
+
+# a single document being written into an in-memory buffer
+class _Document:
+
+    def __init__(self, fields: dict, fmt: str):
+        if fmt not in FORMATS:
+            raise ValueError(f'unknown format {fmt}')
+        self._fields = fields
+        self._keys = list(fields.keys())
+        self._fmt = fmt
+        self._buffer = io.BytesIO()
+        self._raw = gzip.GzipFile(fileobj=self._buffer, mode='wb') if fmt == 'csv.gz' else self._buffer
+        self._out = io.TextIOWrapper(self._raw, encoding='utf-8', newline='' if fmt.startswith('csv') else '\n')
+        self._csv = csv.writer(self._out) if fmt.startswith('csv') else None
+
+        if fmt == 'html':
+            text.htable_head(self._out, list(fields.values()))
+        elif self._csv is not None:
+            self._csv.writerow(fields.values())
+
+    def size(self) -> int:
+        return self._buffer.tell()
+
+    def write(self, row):
+        if self._fmt == 'html':
+            text.htable_row(self._out, row)
+        elif self._csv is not None:
+            self._csv.writerow(row)
+        else:
+            self._out.write(json.dumps(dict(zip(self._keys, row)), ensure_ascii=False))
+            self._out.write('\n')
+
+    def close(self, exceeds=False) -> io.BytesIO:
+        if self._fmt == 'html':
+            text.htable_tail(self._out, exceeds)
+        self._out.flush()
+        self._out.detach()
+        if self._raw is not self._buffer:
+            self._raw.close()
+        self._buffer.seek(0)
+        return self._buffer
+
+
+# streams the rows (any iterable, in the order of fields, which maps column
+# names to labels) into an in-memory file ready to be uploaded. Nothing is
+# written to disk and nothing is shared between calls.
+def export_table(fields: dict, rows, fmt=DEFAULT_FORMAT, exceeds=False) -> io.BytesIO:
+    document = _Document(fields, fmt)
+    for row in rows:
+        document.write(row)
+    return document.close(exceeds)
+
+
+# same as export_table, but starts a new document (with its own header)
+# whenever the current one reaches part_size, so at most one part is held
+# in memory whatever the number of rows. Yields nothing if there are no rows.
+def export_parts(fields: dict, rows, fmt=DEFAULT_FORMAT, part_size=PART_SIZE):
+    document = None
+    for row in rows:
+        if document is not None and document.size() >= part_size:
+            yield document.close()
+            document = None
+        if document is None:
+            document = _Document(fields, fmt)
+        document.write(row)
+    if document is not None:
+        yield document.close()
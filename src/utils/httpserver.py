@@ -0,0 +1,141 @@
+import asyncio
+
+MAX_BODY = 1024 * 1024
+MAX_HEADERS = 100
+# to receive a whole request, including the wait for the next one on an idle
+# keep-alive connection
+READ_TIMEOUT = 30
+reasons = {
+    200: 'OK',
+    400: 'Bad Request',
+    401: 'Unauthorized',
+    403: 'Forbidden',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    408: 'Request Timeout',
+    411: 'Length Required',
+    413: 'Payload Too Large',
+    429: 'Too Many Requests',
+    500: 'Internal Server Error',
+    503: 'Service Unavailable'
+}
+
+
+class Request:
+    __slots__ = ('method', 'path', 'headers', 'body')
+
+    def __init__(self, method: str, path: str, headers: dict, body: bytes):
+        self.method = method
+        self.path = path
+        self.headers = headers
+        self.body = body
+
+
+# minimal HTTP/1.1 server with keep-alive, enough for local endpoints (metrics)
+# and for stand-in servers in benchmarks and tests; the public webhook runs on
+# aiohttp (src/bot/webhook.py). handler is an async callable taking a Request
+# and returning (status, content type, body).
+class HttpServer:
+
+    def __init__(self, handler, host='127.0.0.1', port=0, max_body=MAX_BODY, timeout=READ_TIMEOUT):
+        self._handler = handler
+        self._host = host
+        self._port = port
+        self._max_body = max_body
+        self._timeout = timeout
+        self._server = None
+        self._connections = set()
+        self._closing = False
+
+    @property
+    def port(self) -> int:
+        return self._server.sockets[0].getsockname()[1] if self._server else self._port
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._serve, self._host, self._port)
+
+    async def _read_request(self, reader):
+        line = await reader.readline()
+        if not line:
+            return None
+        method, path, _ = line.decode('latin-1').split(' ', 2)
+
+        headers = {}
+        for _ in range(MAX_HEADERS):
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            return Request(method, path, headers, None)
+        length = int(headers.get('content-length', 0))
+        if length > self._max_body:
+            return Request(method, path, headers, None)
+        body = await reader.readexactly(length) if length > 0 else b''
+        return Request(method, path, headers, body)
+
+    @staticmethod
+    def _write_response(writer, status: int, content_type: str, body: bytes, close: bool):
+        head = (
+            f'HTTP/1.1 {status} {reasons.get(status, "Unknown")}\r\n'
+            f'Content-Type: {content_type}\r\n'
+            f'Content-Length: {len(body)}\r\n'
+            f'Connection: {"close" if close else "keep-alive"}\r\n\r\n'
+        )
+        writer.write(head.encode('latin-1') + body)
+
+    async def _serve(self, reader, writer):
+        task = asyncio.current_task()
+        self._connections.add(task)
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(self._read_request(reader), self._timeout)
+                except asyncio.TimeoutError:
+                    self._write_response(writer, 408, 'text/plain', b'', True)
+                    break
+                except (ValueError, asyncio.IncompleteReadError):
+                    self._write_response(writer, 400, 'text/plain', b'', True)
+                    break
+                if request is None:
+                    break
+
+                if request.body is None:
+                    status = 411 if 'transfer-encoding' in request.headers else 413
+                    self._write_response(writer, status, 'text/plain', b'', True)
+                    break
+
+                try:
+                    status, content_type, body = await self._handler(request)
+                except Exception as e:
+                    print(f'Error handling {request.method} {request.path}: {e}')
+                    status, content_type, body = 500, 'text/plain', b''
+
+                close = request.headers.get('connection', '').lower() == 'close'
+                self._write_response(writer, status, content_type, body, close)
+                await writer.drain()
+                if close:
+                    break
+        except ConnectionError:
+            pass
+        except asyncio.CancelledError:
+            # close() ending the connection is a normal way out, any other
+            # cancellation belongs to whoever asked for it
+            if not self._closing:
+                raise
+        finally:
+            self._connections.discard(task)
+            writer.close()
+
+    async def close(self):
+        if self._server is None:
+            return
+        self._closing = True
+        self._server.close()
+        for task in list(self._connections):
+            task.cancel()
+        await self._server.wait_closed()
+        self._server = None
+        self._closing = False
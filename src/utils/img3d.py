@@ -1,12 +1,23 @@
-import os
 import asyncio
+import bisect
+import hashlib
+import zlib
+from src.datamanagement.database.RenderStore import RenderStore
+from src.utils.blenderpool import BlenderPool
+from src.utils.renderscheduler import RenderScheduler
+from src.utils import metrics
 
 
 STAR_FILE = 'resources/blender/star_script.txt'
 ROCKY_FILE = 'resources/blender/rocky_planet_script.txt'
 GASSY_FILE = 'resources/blender/gassy_planet_script.txt'
-IMG_DIR = 'resources/img/'
+SCRIPTS = [STAR_FILE, ROCKY_FILE, GASSY_FILE]
 WORKING_DIRECTORY = '/home/salvatore/Scrivania/lexarchive'
+POOL_SIZE = 2
+JOB_TIMEOUT = 180
+JOBS_PER_WORKER = 25
+RENDERS_PER_USER = 1
+RENDER_TIMEOUT = 240
 spec_types = {
     "O": "0.0 0.0 1.0 1.0",
     "B": "0.0 0.0 1.0 1.0",
@@ -19,45 +30,150 @@ spec_types = {
     "T": "0.55 0.0 0.0 1.0",
     "Y": "0.5 0.0 0.5 1.0"
 }
+PREVIEW = 'preview'
+FINAL = 'final'
+# previews are cheaper and run before any queued final render
+quality_tiers = {
+    PREVIEW: {
+        'priority': 0,
+        'resolution_x': 480,
+        'resolution_y': 270,
+        'samples': 8,
+        'subdivision': 1
+    },
+    FINAL: {
+        'priority': 1,
+        'resolution_x': 1920,
+        'resolution_y': 1080,
+        'samples': 64,
+        'subdivision': 2
+    }
+}
+# every parameter is bucketed, so the number of distinct renders stays bounded
+# and two planets with similar data share the same picture
+RADIUS_BOUNDS = [0.5, 1, 1.5, 2, 4, 8, 16]
+EQT_BOUNDS = [150, 250, 350, 500, 800, 1200, 2000]
+ORBIT_BOUNDS = [0.02, 0.05, 0.1, 0.5, 1, 2, 5, 10]
+TEFF_BOUNDS = [550, 1300, 2400, 3700, 5200, 6000, 7500, 10000, 30000]
+TEFF_CLASSES = ['Y', 'T', 'L', 'M', 'K', 'G', 'F', 'A', 'B', 'O']
+eqt_tints = [
+    '0.55,0.75,1.0,1.0',
+    '0.7,0.85,1.0,1.0',
+    '0.85,0.95,0.9,1.0',
+    '1.0,1.0,1.0,1.0',
+    '1.0,0.9,0.75,1.0',
+    '1.0,0.75,0.5,1.0',
+    '1.0,0.55,0.3,1.0',
+    '1.0,0.35,0.15,1.0'
+]
+orbit_energies = [30000, 24000, 20000, 16000, 12000, 10000, 8000, 6000, 4000]
 SOLAR_RAD = 695700
 AU_TO_KM = 1.496e8
 
+pool = BlenderPool(
+    SCRIPTS,
+    size=POOL_SIZE,
+    timeout=JOB_TIMEOUT,
+    max_jobs=JOBS_PER_WORKER,
+    cwd=WORKING_DIRECTORY
+)
+scheduler = RenderScheduler(
+    max_concurrency=POOL_SIZE,
+    per_user=RENDERS_PER_USER,
+    timeout=RENDER_TIMEOUT
+)
+store = RenderStore()
+# set in worker processes (src/bot/workers.py): their renders go through the
+# parent's scheduler and pool, so there's a single Blender pool per bot
+remote = None
+
+
+def get_bucket(value, bounds):
+    return -1 if value is None else bisect.bisect_right(bounds, value)
+
+
+def get_spectral_class(spectype, teff):
+    if spectype:
+        for key in spec_types:
+            if key in spectype:
+                return key
+    if teff is not None:
+        return TEFF_CLASSES[get_bucket(teff, TEFF_BOUNDS)]
+    return 'G'
+
+
+def get_seed(script, params) -> int:
+    string = script + '&' + '&'.join(f'{key}={params[key]}' for key in sorted(params))
+    return zlib.crc32(string.encode()) & 0x7fffffff
+
+
+def get_planet_render_params(data):
+    rade, mass = data['pl_rade'], data['pl_bmasse']
+    script = ROCKY_FILE if (rade is None or rade <= 2) and (mass is None or mass <= 10) else GASSY_FILE
+
+    radius = get_bucket(rade, RADIUS_BOUNDS)
+    eqt = get_bucket(data['pl_eqt'], EQT_BOUNDS)
+    orbit = get_bucket(data['pl_orbsmax'], ORBIT_BOUNDS)
+    light = get_spectral_class(None, data['st_teff'])
+    params = {
+        'scale': 1.0 if radius == -1 else round(1.5 - radius * 0.125, 3),
+        'tint': eqt_tints[3] if eqt == -1 else eqt_tints[eqt],
+        'light_energy': orbit_energies[4] if orbit == -1 else orbit_energies[orbit],
+        'light_color': ','.join(spec_types[light].split()[:3])
+    }
+    params['seed'] = get_seed(script, params)
+    return script, params
+
+
+def get_star_render_params(data):
+    spectral_class = get_spectral_class(data['st_spectype'], data['st_teff'])
+    params = {'color': ','.join(spec_types[spectral_class].split())}
+    params['seed'] = get_seed(STAR_FILE, params)
+    return STAR_FILE, params
+
+
+def get_render_params(data, is_planet):
+    return get_planet_render_params(data) if is_planet else get_star_render_params(data)
+
+
+# identifies a picture: same key, same bytes
+def get_render_key(script, params, tier) -> str:
+    string = script + '&' + '&'.join(f'{key}={params[key]}' for key in sorted(params)) + '&' + tier
+    return hashlib.sha1(string.encode()).hexdigest()
+
 
-def get_star_color_rgba(string):
-    for key in spec_types:
-        if key in string:
-            return spec_types[key]
+def get_script_args(params, tier):
+    args = [f'{key}={val}' for key, val in quality_tiers[tier].items() if key != 'priority']
+    return args + [f'{key}={val}' for key, val in params.items()]
 
-    return spec_types['G']
 
+def get_celestial_body_key(data, is_planet, tier=FINAL) -> str:
+    script, params = get_render_params(data, is_planet)
+    return get_render_key(script, params, tier)
 
-async def run_blender_star_script(chat, data):
-    color = get_star_color_rgba(data['st_spectype'])
-    command = f'/opt/blender/blender -b -P {STAR_FILE} -- {color} -- {chat}'
-    shell = await asyncio.create_subprocess_shell(command, cwd=WORKING_DIRECTORY, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
-    stdin, stderr = await shell.communicate()
-    print(stderr)
 
+# pre-rendered (or previously rendered) pictures, see src/utils/prerender.py
+def get_stored_render(data, is_planet, tier=FINAL):
+    return store.get(get_celestial_body_key(data, is_planet, tier))
 
-async def run_blender_planet_script(chat, data):
-    if data['pl_rade'] <= 2 and data['pl_bmasse'] <= 10:
-        await run_rocky_planet_script(chat, data)
-    else:
-        await run_gassy_planet_script(chat, data)
 
+async def run_blender_script(script, params, tier=FINAL) -> bytes:
+    with metrics.render_seconds.time(tier):
+        png = await pool.render(script, get_script_args(params, tier))
+    if tier == FINAL:
+        await asyncio.to_thread(store.put, get_render_key(script, params, tier), png)
+    return png
 
-async def run_rocky_planet_script(chat, data):
-    command = f'/opt/blender/blender -b -P {ROCKY_FILE} -- {chat}'
-    shell = await asyncio.create_subprocess_shell(command, cwd=WORKING_DIRECTORY, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
-    stdin, stderr = await shell.communicate()
-    print(stderr)
 
+async def render_celestial_body(user, data, is_planet, tier=FINAL) -> bytes:
+    if remote is not None:
+        return await remote.render(user, dict(data), is_planet, tier)
+    script, params = get_render_params(data, is_planet)
+    key = get_render_key(script, params, tier)
+    priority = quality_tiers[tier]['priority']
+    return await scheduler.submit(user, key, lambda: run_blender_script(script, params, tier), priority)
 
-async def run_gassy_planet_script(chat, data):
-    command = f'/opt/blender/blender -b -P {GASSY_FILE} -- {chat}'
-    shell = await asyncio.create_subprocess_shell(command, cwd=WORKING_DIRECTORY, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
-    stdin, stderr = await shell.communicate()
-    print(stderr)
 
-def delete_render_png(file_id):
-    os.remove(f'{IMG_DIR}{file_id}.png')
+# renders waiting for a Blender worker
+def queue_depth() -> int:
+    return remote.depth() if remote is not None else scheduler.depth()
@@ -0,0 +1,99 @@
+import bisect
+import hashlib
+from telegram import InlineQueryResultArticle, InputTextMessageContent
+
+NGRAM = 3
+PAGE_SIZE = 20
+CACHE_TIME = 300
+FIELD, PLANET, HOST = 'field', 'planet', 'host'
+descriptions = {
+    FIELD: 'Field definition',
+    PLANET: 'Planet',
+    HOST: 'Host star'
+}
+
+
+def normalize(string: str) -> str:
+    return ''.join(string.lower().split())
+
+
+def _ngrams(string: str):
+    return {string[i:i + NGRAM] for i in range(len(string) - NGRAM + 1)}
+
+
+# built once over field definitions, planet names and host names. Entries are
+# kept sorted by normalized title: short queries are a bisect over the titles,
+# longer ones intersect the posting lists of their n-grams and check the
+# candidates. Result ids only depend on the entry, so Telegram can cache them.
+class InlineIndex:
+
+    def __init__(self, generation=0):
+        self.generation = generation
+        self._entries = []
+        self._keys = []
+        self._postings = {}
+        self._results = {}
+
+    def build(self, definitions: dict, planets, hosts):
+        entries = [(normalize(key), FIELD, key, value) for key, value in definitions.items()]
+        entries += [(normalize(name), PLANET, name, name) for name in planets]
+        entries += [(normalize(name), HOST, name, name) for name in hosts]
+        entries.sort()
+
+        self._entries = entries
+        self._keys = [entry[0] for entry in entries]
+        postings = {}
+        for i, key in enumerate(self._keys):
+            for gram in _ngrams(key):
+                postings.setdefault(gram, []).append(i)
+        self._postings = postings
+        self._results = {}
+        return self
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _prefix(self, query: str) -> list:
+        start = bisect.bisect_left(self._keys, query)
+        end = bisect.bisect_left(self._keys, query + '\uffff', start)
+        return list(range(start, end))
+
+    def _substring(self, query: str) -> list:
+        lists = sorted((self._postings.get(gram, []) for gram in _ngrams(query)), key=len)
+        if not lists or not lists[0]:
+            return []
+        candidates = set(lists[0])
+        for posting in lists[1:]:
+            candidates.intersection_update(posting)
+            if not candidates:
+                return []
+        matches = [i for i in sorted(candidates) if query in self._keys[i]]
+        # titles starting with the query first, each group in title order
+        return [i for i in matches if self._keys[i].startswith(query)] + \
+               [i for i in matches if not self._keys[i].startswith(query)]
+
+    def search(self, query: str) -> list:
+        query = normalize(query)
+        if not query:
+            return []
+        return self._prefix(query) if len(query) < NGRAM else self._substring(query)
+
+    def _result(self, i: int) -> InlineQueryResultArticle:
+        result = self._results.get(i)
+        if result is None:
+            _, kind, title, content = self._entries[i]
+            result = InlineQueryResultArticle(
+                id=f'{kind}-{hashlib.sha1(title.encode()).hexdigest()}',
+                title=title,
+                description=descriptions[kind],
+                input_message_content=InputTextMessageContent(content)
+            )
+            self._results[i] = result
+        return result
+
+    # one page of results and the offset of the next one ('' when it's the last)
+    def page(self, query: str, offset: int):
+        matches = self.search(query)
+        results = [self._result(i) for i in matches[offset:offset + PAGE_SIZE]]
+        next_offset = str(offset + PAGE_SIZE) if offset + PAGE_SIZE < len(matches) else ''
+        return results, next_offset
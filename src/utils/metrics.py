@@ -0,0 +1,194 @@
+import bisect
+import functools
+import time
+
+# seconds, from a fast SQLite lookup to a full quality Blender render
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 180.0)
+registry = {}
+# counters and histograms of other processes (src/bot/workers.py), by source:
+# rendered summed up with the local ones
+remote = {}
+
+
+def _labels(label_name, label) -> str:
+    return f'{{{label_name}="{label}"}}' if label is not None else ''
+
+
+class Counter:
+
+    def __init__(self, name: str, help: str, label_name=None):
+        self.name = name
+        self.help = help
+        self.label_name = label_name
+        self._values = {}
+
+    def inc(self, label=None, amount=1):
+        self._values[label] = self._values.get(label, 0) + amount
+
+    def export(self) -> dict:
+        return dict(self._values)
+
+    def render(self) -> list:
+        values = self.export()
+        for exported in remote.values():
+            for label, value in exported.get(self.name, {}).items():
+                values[label] = values.get(label, 0) + value
+
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        for label, value in values.items():
+            lines.append(f'{self.name}{_labels(self.label_name, label)} {value}')
+        return lines
+
+
+# value read when the metrics are scraped: queue depths, cache sizes, or
+# totals other modules already keep (kind is 'gauge' or 'counter')
+class Callback:
+
+    def __init__(self, name: str, help: str, fn, kind='gauge'):
+        self.name = name
+        self.help = help
+        self._fn = fn
+        self._kind = kind
+
+    def render(self) -> list:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self._kind}']
+        try:
+            lines.append(f'{self.name} {self._fn()}')
+        except Exception as e:
+            print(f'Error reading metric {self.name}: {e}')
+        return lines
+
+
+# counts per bucket are kept non-cumulative, so an observation is one bisect
+# and two additions; they're summed up only when rendered
+class Histogram:
+
+    def __init__(self, name: str, help: str, label_name=None, buckets=BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_name = label_name
+        self._buckets = buckets
+        self._series = {}
+
+    def observe(self, value: float, label=None):
+        series = self._series.get(label)
+        if series is None:
+            series = self._series[label] = [[0] * (len(self._buckets) + 1), 0.0]
+        series[0][bisect.bisect_left(self._buckets, value)] += 1
+        series[1] += value
+
+    def time(self, label=None):
+        return _Timer(self, label)
+
+    def export(self) -> dict:
+        return {label: [list(counts), total] for label, (counts, total) in self._series.items()}
+
+    def render(self) -> list:
+        series = self.export()
+        for exported in remote.values():
+            for label, (counts, total) in exported.get(self.name, {}).items():
+                mine = series.get(label)
+                if mine is None:
+                    series[label] = [list(counts), total]
+                else:
+                    mine[0] = [a + b for a, b in zip(mine[0], counts)]
+                    mine[1] += total
+
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        for label, (counts, total) in series.items():
+            prefix = f'{self.label_name}="{label}",' if label is not None else ''
+            cumulative = 0
+            for bound, count in zip(self._buckets, counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            cumulative += counts[-1]
+            lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.label_name, label)} {total}')
+            lines.append(f'{self.name}_count{_labels(self.label_name, label)} {cumulative}')
+        return lines
+
+
+class _Timer:
+    __slots__ = ('_histogram', '_label', '_start')
+
+    def __init__(self, histogram: Histogram, label):
+        self._histogram = histogram
+        self._label = label
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._histogram.observe(time.perf_counter() - self._start, self._label)
+        return False
+
+
+def _register(metric):
+    # modules can be reloaded, the first definition wins
+    return registry.setdefault(metric.name, metric)
+
+
+def counter(name: str, help: str, label_name=None) -> Counter:
+    return _register(Counter(name, help, label_name))
+
+
+def histogram(name: str, help: str, label_name=None, buckets=BUCKETS) -> Histogram:
+    return _register(Histogram(name, help, label_name, buckets))
+
+
+def callback(name: str, help: str, fn, kind='gauge') -> Callback:
+    registry[name] = Callback(name, help, fn, kind)
+    return registry[name]
+
+
+# counters and histograms of this process, to be merged into another one's;
+# callbacks read live state and stay where they are
+def snapshot() -> dict:
+    return {name: metric.export() for name, metric in list(registry.items()) if hasattr(metric, 'export')}
+
+
+# a process sends its whole snapshot every time, the last one replaces the
+# previous
+def merge(source, values: dict):
+    remote[source] = values
+
+
+def render() -> str:
+    lines = []
+    for metric in list(registry.values()):
+        lines += metric.render()
+    return '\n'.join(lines) + '\n'
+
+
+handler_seconds = histogram('lexarchive_handler_seconds', 'Time spent handling an update, by command.', 'command')
+handler_errors = counter('lexarchive_handler_errors_total', 'Handlers that raised, by command.', 'command')
+db_query_seconds = histogram('lexarchive_db_query_seconds', 'Time spent in archive database queries.')
+tap_sync_seconds = histogram('lexarchive_tap_sync_seconds', 'Time spent downloading and storing the TAP tables.')
+sky_fetch_seconds = histogram('lexarchive_sky_fetch_seconds', 'Time spent fetching and drawing SkyView images.')
+render_seconds = histogram('lexarchive_render_seconds', 'Time spent in Blender renders, by quality tier.', 'tier')
+send_seconds = histogram('lexarchive_telegram_send_seconds', 'Time spent in Telegram send calls.')
+
+
+# wraps a PTB callback so its latency and errors are recorded under name
+def instrument(name: str, handler):
+    @functools.wraps(handler)
+    async def wrapper(update, context):
+        start = time.perf_counter()
+        try:
+            return await handler(update, context)
+        except Exception:
+            handler_errors.inc(name)
+            raise
+        finally:
+            handler_seconds.observe(time.perf_counter() - start, name)
+    return wrapper
+
+
+# handler for src.utils.httpserver.HttpServer
+async def handle(request):
+    if request.method != 'GET':
+        return 405, 'text/plain', b''
+    if request.path.split('?', 1)[0] != '/metrics':
+        return 404, 'text/plain', b''
+    return 200, 'text/plain; version=0.0.4', render().encode()
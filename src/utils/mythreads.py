@@ -1,130 +1,207 @@
-import threading
-import time
 import asyncio
-import os
-from datetime import datetime, timezone
-from src.utils import research
+import bisect
+import time
+import traceback
+from datetime import datetime, timezone, timedelta
+from typing import NamedTuple
+from src.utils import prerender, news, metrics, profiling
+from src.utils.broadcast import Broadcaster
 from src.datamanagement.tap import TapClient
-
-LOOP = asyncio.get_event_loop()
-
-
-class NewsScheduler(threading.Thread):
-    _FILE = 'resources/data/subscribers.txt'
-
-    def __init__(self, bot, sub_lock: threading.RLock, news_lock: threading.RLock):
-        super().__init__()
-        self._sub_lock = sub_lock
-        self._news_lock = news_lock
-        self._bot = bot
-        self._subs = {}
-        self._last_mtime = 0
-
-    def _read(self):
-        try:
-            with self._sub_lock:
-                current_mtime = os.path.getmtime(self._FILE)
-                if current_mtime != self._last_mtime:
-                    with open(self._FILE, 'r') as file:
-                        self._subs = {line.strip().split('-')[0]: line.strip().split('-')[1] for line in file}
-                    self._last_mtime = current_mtime
-        except IOError as e:
-            print(f'Error trying to open subscribers file: {e}')
-
-    def run(self):
+from src.datamanagement.database import SubManager
+
+
+# subscribers are kept in a timing wheel with one bucket per minute of the day
+# (UTC), plus the sorted list of non-empty minutes. The task sleeps until the
+# next non-empty bucket and is woken up early when a subscription changes.
+class NewsScheduler:
+    _MINUTES = 1440
+
+    def __init__(self, broadcaster: Broadcaster):
+        self._broadcaster = broadcaster
+        self._wheel = [set() for _ in range(NewsScheduler._MINUTES)]
+        self._active = []
+        self._minutes = {}
+        self._changed = asyncio.Event()
+        self._sending = set()
+
+    @staticmethod
+    def to_minute(hhmm: str) -> int:
+        hours, minutes = hhmm.split(':')
+        return int(hours) * 60 + int(minutes)
+
+    def load(self):
+        subs = SubManager.get_subscriptions()
+        if subs is None:
+            return False
+        for chat_id, minute in subs:
+            self.add(chat_id, minute)
+        return True
+
+    def add(self, chat_id: int, minute: int):
+        self.remove(chat_id)
+        if not self._wheel[minute]:
+            bisect.insort(self._active, minute)
+        self._wheel[minute].add(chat_id)
+        self._minutes[chat_id] = minute
+        self._changed.set()
+
+    def remove(self, chat_id: int):
+        minute = self._minutes.pop(chat_id, None)
+        if minute is None:
+            return
+        self._wheel[minute].discard(chat_id)
+        if not self._wheel[minute]:
+            self._active.remove(minute)
+        self._changed.set()
+
+    # first moment, not before cursor, with someone subscribed
+    def _next_due(self, cursor: datetime):
+        if not self._active:
+            return None
+        minute = cursor.hour * 60 + cursor.minute
+        i = bisect.bisect_left(self._active, minute)
+        midnight = cursor.replace(hour=0, minute=0)
+        if i < len(self._active):
+            return midnight + timedelta(minutes=self._active[i])
+        return midnight + timedelta(days=1, minutes=self._active[0])
+
+    def _deliver(self, minute: int):
+        # every chat gets its own link
+        task = asyncio.create_task(self._broadcaster.broadcast(list(self._wheel[minute]), news.pool.sample))
+        self._sending.add(task)
+        task.add_done_callback(self._sending.discard)
+
+    async def run(self):
+        cursor = datetime.now(timezone.utc).replace(second=0, microsecond=0)
         while True:
-            self._read()
-            current_time = datetime.now(timezone.utc).strftime('%H:%M')
-            to_notify = [chat_id for chat_id in self._subs if self._subs[chat_id] == current_time]
-            if len(to_notify) > 0:
-                with self._news_lock:
-                    link = research.get_rand_news()
-            for user in to_notify:
-                LOOP.call_soon_threadsafe(asyncio.create_task, self._bot.send_message(
-                    chat_id=user,
-                    text=link
-                ))
-            time.sleep(60)
-
-
-class NewsFetcher(threading.Thread):
-    _FILE = 'resources/data/news.txt'
-
-    def __init__(self, lock: threading.RLock):
-        super().__init__()
-        self._lock = lock
-
-    def run(self):
-        while True:
-            news = research.fetch_news()
-            if news != '':
-                with self._lock:
-                    try:
-                        with open(NewsFetcher._FILE, 'w') as file:
-                            file.write(news)
-                    except IOError as e:
-                        print(f'Error trying to open news file: {e}')
-            time.sleep(86400)
-
+            self._changed.clear()
+            due = self._next_due(cursor)
+            delay = None if due is None else (due - datetime.now(timezone.utc)).total_seconds()
+            if delay is None or delay > 0:
+                try:
+                    await asyncio.wait_for(self._changed.wait(), delay)
+                    continue
+                except asyncio.TimeoutError:
+                    pass
 
-class ArchiveUpdater(threading.Thread):
+            # a late wake up still delivers the bucket it was waiting for
+            self._deliver(due.hour * 60 + due.minute)
+            cursor = due + timedelta(minutes=1)
 
-    def __init__(self, bot=None, ids=None, sleep_lock=None, ids_lock=None):
-        super().__init__()
-        self._bot = bot
-        self._ids = ids
-        self._sleeping = False
-        self._sleep_lock = sleep_lock
-        self._ids_lock = ids_lock
 
-    def set_bot(self, bot):
-        self._bot = bot
+class NewsFetcher:
+    _INTERVAL = 86400
 
-    def set_ids(self, ids):
-        self._ids = ids
+    def __init__(self, pool: news.NewsPool):
+        self._pool = pool
+        self._pipeline = news.NewsPipeline(news.load_sources())
 
+    async def run(self):
+        try:
+            while True:
+                items = await self._pipeline.run(self._pool.items())
+                if len(items) > 0:
+                    self._pool.publish(items)
+                    await asyncio.to_thread(self._pool.snapshot)
+                await asyncio.sleep(NewsFetcher._INTERVAL)
+        finally:
+            await self._pipeline.close()
+
+
+# state of the archive seen by commands. It's never modified: every transition
+# publishes a new one with a single assignment, so a reader can't observe a
+# half-done change. number grows by one after each completed update.
+class Generation(NamedTuple):
+    number: int
+    updating: bool
+    since: float
+
+
+# runs on the bot's event loop: the TAP download and the database rewrite go
+# to a worker thread, commands only read the current generation. A failed
+# sync leaves the archive as it was and is tried again after _RETRY seconds.
+class ArchiveUpdater:
+    _INTERVAL = 86400
+    _RETRY = 900
+
+    def __init__(self, broadcaster=None, sessions=None):
+        self._broadcaster = broadcaster
+        self._sessions = sessions
+        self.generation = Generation(0, True, time.time())
+        self._sending = set()
+        self._refreshing = set()
+        self._listeners = []
+
+    @property
+    def broadcaster(self) -> Broadcaster:
+        return self._broadcaster
+
+    def set_broadcaster(self, broadcaster: Broadcaster):
+        self._broadcaster = broadcaster
+
+    def set_sessions(self, sessions):
+        self._sessions = sessions
+
+    # notices go to the chats with a live session only
     def get_ids(self):
-        with self._ids_lock:
-            return self._ids
-
-    def set_sleep_lock(self, lock):
-        self._sleep_lock = lock
-
-    def set_ids_lock(self, lock):
-        self._ids_lock = lock
-
-    def add_id(self, id: int):
-        with self._ids_lock:
-            self._ids.append(id)
-
-    def is_sleeping(self):
-        with self._sleep_lock:
-            return self._sleeping
-
-    def _set_sleeping(self, b: bool):
-        with self._sleep_lock:
-            self._sleeping = b
-
-    def run(self):
-        TapClient.load_fields()
-        while True:
-            ids = self.get_ids()
-            for chat_id in ids:
-                LOOP.call_soon_threadsafe(asyncio.create_task, self._bot.send_message(
-                    chat_id=chat_id,
-                    text='We\'re currently updating the database, all commands are unavailable. We\'ll be back in a '
-                         'moment.'
-                ))
-
-            TapClient.update()
-
-            ids = self.get_ids()
-            for chat_id in ids:
-                LOOP.call_soon_threadsafe(asyncio.create_task, self._bot.send_message(
-                    chat_id=chat_id,
-                    text='We\'ve updated the database, all commands are now available.'
-                ))
-
-            self._set_sleeping(True)
-            time.sleep(86400)
-            self._set_sleeping(False)
+        return self._sessions.ids() if self._sessions is not None else []
+
+    # listener(generation) is called on every transition, when an update
+    # starts and when it completes
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    def _publish(self, updating: bool):
+        number = self.generation.number + (0 if updating else 1)
+        self.generation = Generation(number, updating, time.time())
+        for listener in self._listeners:
+            try:
+                listener(self.generation)
+            except Exception as e:
+                print(f'Error in update listener: {e}')
+
+    def _broadcast(self, text: str):
+        task = asyncio.create_task(self._broadcaster.broadcast(self.get_ids(), text))
+        self._sending.add(task)
+        task.add_done_callback(self._sending.discard)
+
+    # renders of new planets are made after commands are back online, on
+    # their own: however long they take, the next sync starts on time
+    def _refresh(self, changed):
+        task = asyncio.create_task(prerender.refresh(changed))
+        self._refreshing.add(task)
+        task.add_done_callback(self._refresh_done)
+
+    def _refresh_done(self, task):
+        self._refreshing.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            print(f'Error pre-rendering the updated planets: {task.exception()}')
+
+    async def _sync(self):
+        self._broadcast('We\'re currently updating the database, all commands are unavailable. We\'ll be back in a '
+                        'moment.')
+        try:
+            with metrics.tap_sync_seconds.time():
+                changed = await asyncio.to_thread(profiling.call, 'tap_sync', TapClient.update)
+        finally:
+            # commands are back either way, on the old data if the sync failed
+            self._publish(False)
+        self._broadcast('We\'ve updated the database, all commands are now available.')
+        self._refresh(changed)
+
+    async def run(self):
+        await asyncio.to_thread(TapClient.load_fields)
+        try:
+            while True:
+                delay = ArchiveUpdater._INTERVAL
+                try:
+                    await self._sync()
+                except Exception as e:
+                    print(f'Error updating the archive, retrying in {ArchiveUpdater._RETRY}s: {e}')
+                    traceback.print_exc()
+                    delay = ArchiveUpdater._RETRY
+                await asyncio.sleep(delay)
+                self._publish(True)
+        finally:
+            for task in list(self._refreshing):
+                task.cancel()
@@ -0,0 +1,248 @@
+import asyncio
+import os
+import random
+import time
+import xml.etree.ElementTree as ET
+from abc import ABC, abstractmethod
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+import httpx
+
+SOURCES_PATH = 'resources/config/news_sources.txt'
+NEWS_PATH = 'resources/data/news.txt'
+RETENTION = 7 * 86400
+NO_REPEAT = 3 * 86400
+SAMPLE_TRIES = 8
+TIMEOUT = 20
+MAX_CONNECTIONS = 10
+CHUNK_SIZE = 16 * 1024
+ATOM = '{http://www.w3.org/2005/Atom}'
+
+
+class NewsItem:
+    __slots__ = ('link', 'title', 'timestamp')
+
+    def __init__(self, link: str, title: str, timestamp: float):
+        self.link = link
+        self.title = title
+        self.timestamp = timestamp
+
+
+# strips fragments and tracking parameters, so the same article reached from
+# two feeds is stored once
+def normalize_link(link: str) -> str:
+    parts = urlsplit(link.strip())
+    query = [(k, v) for k, v in parse_qsl(parts.query) if not k.startswith('utm_')]
+    return urlunsplit((parts.scheme, parts.netloc.lower(), parts.path, urlencode(query), ''))
+
+
+def _parse_date(value):
+    if not value:
+        return None
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        pass
+    try:
+        return datetime.fromisoformat(value.strip().replace('Z', '+00:00')).timestamp()
+    except ValueError:
+        return None
+
+
+class NewsSource(ABC):
+
+    def __init__(self, url: str):
+        self.url = url
+
+    @abstractmethod
+    async def fetch(self, client: httpx.AsyncClient) -> list:
+        pass
+
+
+# RSS 2.0 and Atom feeds. The body is parsed while it's being downloaded and
+# every parsed element is dropped right away, so memory doesn't grow with the
+# size of the feed.
+class FeedSource(NewsSource):
+
+    def _item(self, elem):
+        if elem.tag == 'item':
+            link = elem.findtext('link')
+            title = elem.findtext('title')
+            published = elem.findtext('pubDate')
+        elif elem.tag == f'{ATOM}entry':
+            link = None
+            for node in elem.findall(f'{ATOM}link'):
+                if node.get('rel', 'alternate') == 'alternate':
+                    link = node.get('href')
+                    break
+            title = elem.findtext(f'{ATOM}title')
+            published = elem.findtext(f'{ATOM}published') or elem.findtext(f'{ATOM}updated')
+        else:
+            return None
+
+        if not link:
+            return None
+        return NewsItem(
+            normalize_link(link),
+            ' '.join((title or '').split()),
+            _parse_date(published) or time.time()
+        )
+
+    async def fetch(self, client: httpx.AsyncClient) -> list:
+        parser = ET.XMLPullParser(events=('end',))
+        items = []
+        async with client.stream('GET', self.url) as response:
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                parser.feed(chunk)
+                for _, elem in parser.read_events():
+                    item = self._item(elem)
+                    if item is not None:
+                        items.append(item)
+                        elem.clear()
+        parser.close()
+        return items
+
+
+def load_sources(path=SOURCES_PATH) -> list:
+    try:
+        with open(path, 'r') as file:
+            return [FeedSource(line.strip()) for line in file if line.strip() and not line.startswith('#')]
+    except IOError as e:
+        print(f'Error trying to open news sources file: {e}')
+        return []
+
+
+# one line per link: '<timestamp>\t<link>\t<title>'
+def read_news(path=NEWS_PATH) -> list:
+    items = []
+    try:
+        with open(path, 'r') as file:
+            for line in file:
+                parts = line.rstrip('\n').split('\t')
+                if len(parts) == 3:
+                    items.append(NewsItem(parts[1], parts[2], float(parts[0])))
+    except FileNotFoundError:
+        pass
+    except (IOError, ValueError) as e:
+        print(f'Error trying to read news file: {e}')
+    return items
+
+
+# written to a temporary file and renamed, readers never see a partial file
+def write_news(items: list, path=NEWS_PATH) -> bool:
+    tmp = path + '.tmp'
+    try:
+        with open(tmp, 'w') as file:
+            for item in items:
+                file.write(f'{item.timestamp:.0f}\t{item.link}\t{item.title}\n')
+        os.replace(tmp, path)
+        return True
+    except IOError as e:
+        print(f'Error trying to write news file: {e}')
+        return False
+
+
+class NewsPipeline:
+
+    def __init__(self, sources: list, retention=RETENTION):
+        self._sources = sources
+        self._retention = retention
+        self._client = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=TIMEOUT,
+                follow_redirects=True,
+                limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS)
+            )
+        return self._client
+
+    async def _fetch(self, source: NewsSource) -> list:
+        try:
+            return await source.fetch(self._get_client())
+        except (httpx.HTTPError, ET.ParseError) as e:
+            print(f'Error fetching news from {source.url}: {e}')
+            return []
+
+    # merges the fresh items into the known ones: links are unique, known links
+    # keep their timestamp, expired ones are dropped. Newest first.
+    def merge(self, known: list, fetched: list) -> list:
+        limit = time.time() - self._retention
+        merged = {}
+        for item in known + fetched:
+            if item.timestamp >= limit and item.link not in merged:
+                merged[item.link] = item
+        return sorted(merged.values(), key=lambda item: item.timestamp, reverse=True)
+
+    async def run(self, known: list) -> list:
+        results = await asyncio.gather(*[self._fetch(source) for source in self._sources])
+        return self.merge(known, [item for items in results for item in items])
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+# the links served to subscribers. Readers always see a complete tuple, a
+# publish replaces it with a single assignment; news.txt is only a snapshot
+# written after the fact, used to restore the pool on startup.
+class NewsPool:
+
+    def __init__(self, path=NEWS_PATH, no_repeat=NO_REPEAT):
+        self._path = path
+        self._no_repeat = no_repeat
+        self._items = tuple()
+        self._sent = {}
+        self._dirty = False
+
+    def load(self):
+        self._items = tuple(read_news(self._path))
+
+    def items(self) -> list:
+        return list(self._items)
+
+    def publish(self, items: list):
+        self._items = tuple(items)
+        self._dirty = True
+
+    def snapshot(self) -> bool:
+        if not self._dirty:
+            return True
+        self._dirty = False
+        items = self._items
+        if not write_news(list(items), self._path):
+            self._dirty = True
+            return False
+        return True
+
+    # a random link the chat didn't receive in the last no_repeat seconds,
+    # when possible: a bounded number of draws keeps it O(1)
+    def sample(self, chat_id):
+        items = self._items
+        if not items:
+            return None
+
+        now = time.time()
+        sent = self._sent.get(chat_id)
+        if sent is None:
+            sent = self._sent[chat_id] = {}
+        else:
+            for link in [link for link, when in sent.items() if now - when >= self._no_repeat]:
+                del sent[link]
+
+        for _ in range(SAMPLE_TRIES):
+            item = items[random.randrange(len(items))]
+            if item.link not in sent:
+                break
+        sent[item.link] = now
+        return item.link
+
+    def forget(self, chat_id):
+        self._sent.pop(chat_id, None)
+
+
+pool = NewsPool()
@@ -0,0 +1,131 @@
+import argparse
+import asyncio
+import time
+from src.datamanagement.database import DbManager as db
+from src.datamanagement.database.RenderStore import RenderStore
+from src.utils import img3d
+from src.utils.blenderpool import BlenderPool
+
+WORKERS = 4
+PROGRESS_EVERY = 25
+REFRESH_LIMIT = 200
+REFRESH_USER = 'prerender'
+# after both quality tiers of user requests
+REFRESH_PRIORITY = 2
+
+
+# every distinct render needed by the given planets (all of them if names is
+# None) and by their host stars, keyed by render key
+def collect_jobs(names=None, tiers=(img3d.FINAL,)):
+    jobs = {}
+    for is_planet in (True, False):
+        rows = db.get_render_data(is_planet, names)
+        if rows is None:
+            return None
+        for row in rows:
+            script, params = img3d.get_render_params(row, is_planet)
+            for tier in tiers:
+                jobs[img3d.get_render_key(script, params, tier)] = (script, params, tier)
+    return jobs
+
+
+# renders whatever is missing from the store. Every finished picture is
+# committed right away, so an interrupted run picks up where it stopped.
+async def render_catalog(names=None, tier=img3d.FINAL, workers=WORKERS, prune=False):
+    jobs = await asyncio.to_thread(collect_jobs, names, (tier,))
+    if jobs is None:
+        print('Unable to read the archive.')
+        return False
+
+    store = RenderStore()
+    done = store.keys()
+    todo = iter([(key, job) for key, job in jobs.items() if key not in done])
+    total = len(jobs) - len(done & jobs.keys())
+    print(f'{len(jobs)} distinct renders, {len(jobs) - total} already stored, {total} to render.')
+
+    pool = BlenderPool(
+        img3d.SCRIPTS,
+        size=workers,
+        timeout=img3d.JOB_TIMEOUT,
+        max_jobs=img3d.JOBS_PER_WORKER,
+        cwd=img3d.WORKING_DIRECTORY
+    )
+    progress = {'rendered': 0, 'failed': 0}
+    start = time.monotonic()
+
+    async def worker():
+        # the iterator is shared, each job is taken by exactly one worker
+        for key, (script, params, job_tier) in todo:
+            try:
+                png = await pool.render(script, img3d.get_script_args(params, job_tier))
+            except Exception as e:
+                progress['failed'] += 1
+                print(f'Error rendering {key}: {e}')
+                continue
+
+            await asyncio.to_thread(store.put, key, png)
+            progress['rendered'] += 1
+            if progress['rendered'] % PROGRESS_EVERY == 0:
+                elapsed = time.monotonic() - start
+                print(f'{progress["rendered"]}/{total} rendered ({progress["rendered"] / elapsed:.2f} renders/s).')
+
+    try:
+        await pool.start()
+        await asyncio.gather(*[worker() for _ in range(workers)])
+    except Exception as e:
+        print(f'Unable to start the render workers: {e}')
+        store.close()
+        return False
+    finally:
+        await pool.close()
+
+    if prune and names is None:
+        valid = await asyncio.to_thread(collect_jobs, None, tuple(img3d.quality_tiers))
+        if valid is None:
+            print('Unable to read the archive, nothing pruned.')
+        else:
+            print(f'{store.prune(valid.keys())} stale renders removed.')
+    store.close()
+
+    print(f'{progress["rendered"]} rendered, {progress["failed"]} failed.')
+    return progress['failed'] == 0
+
+
+# re-renders only what changed after TapClient.update(), inside the bot: the
+# jobs go through the live scheduler and pool one at a time, after any render
+# a user is waiting for. A sync that touched many planets (the first one
+# fills the whole archive) is left to the offline job.
+async def refresh(names):
+    if not names:
+        return
+    if len(names) > REFRESH_LIMIT:
+        print(f'{len(names)} planets changed, run python -m src.utils.prerender to render them.')
+        return
+
+    jobs = await asyncio.to_thread(collect_jobs, names)
+    if jobs is None:
+        print('Unable to read the archive.')
+        return
+
+    done = img3d.store.keys()
+    for key, (script, params, tier) in jobs.items():
+        if key in done:
+            continue
+        try:
+            # run_blender_script stores the picture
+            await img3d.scheduler.submit(
+                REFRESH_USER, key,
+                lambda script=script, params=params, tier=tier: img3d.run_blender_script(script, params, tier),
+                REFRESH_PRIORITY
+            )
+        except Exception as e:
+            print(f'Error rendering {key}: {e}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Pre-render every planet and host star of the archive.')
+    parser.add_argument('--workers', type=int, default=WORKERS)
+    parser.add_argument('--tier', choices=list(img3d.quality_tiers), default=img3d.FINAL)
+    parser.add_argument('--prune', action='store_true', help='drop renders no celestial body uses anymore')
+    args = parser.parse_args()
+    asyncio.run(render_catalog(tier=args.tier, workers=args.workers, prune=args.prune))
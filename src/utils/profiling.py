@@ -0,0 +1,139 @@
+import cProfile
+import functools
+import io
+import os
+import pstats
+import threading
+import tracemalloc
+from datetime import datetime
+
+PROFILE_DIR = 'resources/profiles'
+CPU, MEMORY = 'cpu', 'memory'
+ALL = 'all'
+TOP = 40
+FRAMES = 10
+# name -> mode, empty unless someone switched profiling on
+targets = {}
+_state = {'memory_sessions': 0, 'dumps': 0}
+_cpu_lock = threading.Lock()
+_memory_lock = threading.Lock()
+
+
+def enable(name: str, mode=CPU):
+    if mode not in (CPU, MEMORY):
+        raise ValueError(f'unknown mode {mode}')
+    targets[name] = mode
+
+
+def disable(name=None):
+    if name is None:
+        targets.clear()
+    else:
+        targets.pop(name, None)
+
+
+# used by the signal handlers: everything on, or everything off
+def toggle(mode=CPU):
+    if targets:
+        disable()
+    else:
+        enable(ALL, mode)
+    print(f'Profiling {"on (" + mode + ")" if targets else "off"}.')
+
+
+def _mode(name: str):
+    return targets.get(name) or targets.get(ALL)
+
+
+def _path(name: str) -> str:
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    _state['dumps'] += 1
+    stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+    return os.path.join(PROFILE_DIR, f'{name}-{stamp}-{_state["dumps"]}')
+
+
+# cProfile can't run twice at once: a call that overlaps another profiled
+# one just isn't profiled
+def _start(mode: str):
+    if mode == CPU:
+        if not _cpu_lock.acquire(blocking=False):
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError as e:
+            # another profiler (a debugger, coverage...) is already attached
+            _cpu_lock.release()
+            print(f'Unable to start profiling: {e}')
+            return None
+        return profile
+
+    with _memory_lock:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(FRAMES)
+        _state['memory_sessions'] += 1
+    return tracemalloc.take_snapshot()
+
+
+def _finish(name: str, mode: str, session):
+    try:
+        if mode == CPU:
+            session.disable()
+            _cpu_lock.release()
+            path = _path(name)
+            session.dump_stats(path + '.prof')
+            summary = io.StringIO()
+            pstats.Stats(session, stream=summary).sort_stats('cumulative').print_stats(TOP)
+            with open(path + '.txt', 'w') as file:
+                file.write(summary.getvalue())
+            return
+
+        after = tracemalloc.take_snapshot()
+        with _memory_lock:
+            _state['memory_sessions'] -= 1
+            if _state['memory_sessions'] == 0:
+                tracemalloc.stop()
+        with open(_path(name) + '.mem.txt', 'w') as file:
+            for stat in after.compare_to(session, 'lineno')[:TOP]:
+                file.write(f'{stat}\n')
+    except (IOError, OSError) as e:
+        print(f'Error writing profile for {name}: {e}')
+
+
+# async handlers: with cProfile on, whatever else the loop runs meanwhile
+# ends up in the same profile. When nothing is switched on the only cost is
+# a dict lookup.
+def wrap(name: str, handler):
+    @functools.wraps(handler)
+    async def wrapper(*args, **kwargs):
+        mode = _mode(name) if targets else None
+        if mode is None:
+            return await handler(*args, **kwargs)
+        session = _start(mode)
+        if session is None:
+            return await handler(*args, **kwargs)
+        try:
+            return await handler(*args, **kwargs)
+        finally:
+            _finish(name, mode, session)
+    return wrapper
+
+
+# same for plain functions, e.g. the ones sent to a worker thread
+def call(name: str, fn, *args, **kwargs):
+    mode = _mode(name) if targets else None
+    if mode is None:
+        return fn(*args, **kwargs)
+    session = _start(mode)
+    if session is None:
+        return fn(*args, **kwargs)
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        _finish(name, mode, session)
+
+
+def status() -> str:
+    if not targets:
+        return 'off'
+    return ', '.join(f'{name} ({mode})' for name, mode in targets.items())
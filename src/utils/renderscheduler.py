@@ -0,0 +1,109 @@
+import asyncio
+import itertools
+from collections import deque
+
+
+class RenderLimitError(Exception):
+    pass
+
+
+class RenderTimeoutError(Exception):
+    pass
+
+
+class SchedulerClosedError(Exception):
+    pass
+
+
+# bounded render queue: at most max_concurrency jobs run at the same time, the
+# others wait in the queue ordered by priority (lower runs first) and then by
+# arrival. Jobs are identified by a key, so concurrent requests for the same
+# target share a single render, and each user can only wait on per_user
+# renders at once.
+class RenderScheduler:
+
+    def __init__(self, max_concurrency=2, per_user=1, timeout=240, samples=100):
+        self._max_concurrency = max_concurrency
+        self._per_user = per_user
+        self._timeout = timeout
+        self._queue = None
+        self._runners = []
+        self._inflight = {}
+        self._users = {}
+        self._running = 0
+        self._waits = deque(maxlen=samples)
+        self._counter = itertools.count()
+
+    def _ensure_started(self):
+        if self._runners:
+            return
+        self._queue = asyncio.PriorityQueue()
+        self._runners = [asyncio.create_task(self._run()) for _ in range(self._max_concurrency)]
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            _, _, key, job, queued_at = await self._queue.get()
+            future = self._inflight[key]
+            self._waits.append(loop.time() - queued_at)
+            self._running += 1
+            try:
+                # wait_for cancels the job on timeout, so its worker gets killed
+                future.set_result(await asyncio.wait_for(job(), self._timeout))
+            except asyncio.TimeoutError:
+                future.set_exception(RenderTimeoutError(f'Render of {key} timed out after {self._timeout}s.'))
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                self._running -= 1
+                del self._inflight[key]
+                self._queue.task_done()
+
+    async def submit(self, user, key, job, priority=0) -> bytes:
+        if self._users.get(user, 0) >= self._per_user:
+            raise RenderLimitError(f'User {user} already has {self._per_user} render(s) in progress.')
+
+        self._ensure_started()
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            # nobody may be waiting anymore when it fails, don't warn about it
+            future.add_done_callback(lambda f: f.cancelled() or f.exception())
+            self._inflight[key] = future
+            self._queue.put_nowait((priority, next(self._counter), key, job, asyncio.get_running_loop().time()))
+
+        self._users[user] = self._users.get(user, 0) + 1
+        try:
+            return await asyncio.shield(future)
+        finally:
+            self._users[user] -= 1
+            if self._users[user] == 0:
+                del self._users[user]
+
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def stats(self) -> dict:
+        waits = list(self._waits)
+        return {
+            'queued': self.depth(),
+            'running': self._running,
+            'inflight': len(self._inflight),
+            'users': len(self._users),
+            'avg_wait': sum(waits) / len(waits) if waits else 0.0,
+            'max_wait': max(waits) if waits else 0.0
+        }
+
+    # jobs still queued or running are dropped, whoever waits on them gets a
+    # SchedulerClosedError instead of waiting forever
+    async def close(self):
+        futures = list(self._inflight.values())
+        for runner in self._runners:
+            runner.cancel()
+        await asyncio.gather(*self._runners, return_exceptions=True)
+        self._runners = []
+        self._queue = None
+        self._inflight.clear()
+        for future in futures:
+            if not future.done():
+                future.set_exception(SchedulerClosedError('The render scheduler was closed.'))
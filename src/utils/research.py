@@ -1,20 +1,12 @@
-from astropy.coordinates import SkyCoord, get_constellation
-import matplotlib
-import matplotlib.pyplot as plt
-from astropy.wcs import WCS
-from astroquery.skyview import SkyView
 from io import BytesIO
-import astropy.units as u
-import random
-from bs4 import BeautifulSoup
 import math
-from src.utils import text
+import time
+from src.utils import text, metrics
 import asyncio
-from playwright.sync_api import sync_playwright
 
-
-matplotlib.use('Agg')
-FILE = 'resources/data/news.txt'
+# astropy, astroquery and matplotlib take seconds to import: they're
+# imported by the functions needing them, on first use (or by warm_up)
+_plt = None
 SOLAR_TEFF = 5778
 UG_CONST = 6.67e-11
 EARTH_MASS = 5.9722e24
@@ -23,38 +15,38 @@ EARTH_RAD = 6371e3
 ALBEDO = 0.3
 STEFAN_BOLTZMANN_CONST = 5.67e-8
 C = 3e8
-user_agent = 'Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:94.0) Gecko/20100101 Firefox/94.0'
-
-
-def fetch_news(keyword='astronomy'):
-    url = f'https://www.google.com/search?q={keyword}'
-    with sync_playwright() as p:
-        browser = p.chromium.launch(headless=True)
-        context = browser.new_context(user_agent=user_agent)
-        page = context.new_page()
-
-        page.goto(url)
-        page.click('button:has-text("Accetta tutto")')
-        page.wait_for_load_state('networkidle')
-        page.click('a:has-text("Notizie")')
-        page.wait_for_load_state('networkidle')
-
-        page_source = page.content()
-        browser.close()
 
-        soup = BeautifulSoup(page_source, 'html.parser')
-        a = soup.find_all('a', class_='WlydOe')
-        return ','.join([link.get('href') for link in a]) if len(a) > 0 else ''
 
-
-def get_rand_news():
-    with open(FILE, 'r') as file:
-        links = file.read().strip().split(',')
-
-    return random.choice(links)
+def pyplot():
+    global _plt
+    if _plt is None:
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+        _plt = plt
+    return _plt
+
+
+# imports everything ahead of the first command needing it, meant to run in
+# a worker thread once the bot is up; returns the seconds it took
+def warm_up():
+    start = time.perf_counter()
+    try:
+        pyplot()
+        from astropy.coordinates import SkyCoord, get_constellation
+        from astropy.wcs import WCS
+        from astroquery.skyview import SkyView
+        import astropy.units as u
+        # the constellation boundaries are read on the first lookup
+        get_constellation(SkyCoord(ra=0, dec=0, unit=(u.deg, u.deg)))
+    except Exception as e:
+        print(f'Error warming up: {e}')
+    return time.perf_counter() - start
 
 
 def get_constellation_from_coordinates(coord, convert_to_sky_coord=False):
+    from astropy.coordinates import SkyCoord, get_constellation
+    import astropy.units as u
     if not convert_to_sky_coord:
         return get_constellation(coord)
     sky_coord = SkyCoord(ra=coord[0], dec=coord[1], unit=(u.hourangle, u.deg))
@@ -62,6 +54,16 @@ def get_constellation_from_coordinates(coord, convert_to_sky_coord=False):
 
 
 async def fetch_sky_image(pair, constellation):
+    with metrics.sky_fetch_seconds.time():
+        return await _fetch_sky_image(pair, constellation)
+
+
+async def _fetch_sky_image(pair, constellation):
+    from astropy.coordinates import SkyCoord
+    from astropy.wcs import WCS
+    from astroquery.skyview import SkyView
+    import astropy.units as u
+    plt = pyplot()
     coord = SkyCoord(ra=pair[0], dec=pair[1], unit=(u.hourangle, u.deg ))
     image_list = await asyncio.to_thread(SkyView.get_images, position=coord, survey=['DSS'], pixels=750)
     data = image_list[0][0].data
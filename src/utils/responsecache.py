@@ -0,0 +1,59 @@
+from collections import OrderedDict
+
+MAX_ENTRIES = 5000
+
+
+# replies of commands that only depend on the archive, keyed by (command,
+# normalized args). Every entry belongs to the dataset generation it was
+# computed on: the first lookup with a newer generation drops them all.
+class ResponseCache:
+
+    def __init__(self, capacity=MAX_ENTRIES):
+        self._capacity = capacity
+        self._entries = OrderedDict()
+        self._generation = None
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._invalidations = 0
+
+    def _check_generation(self, generation: int):
+        if generation != self._generation:
+            if self._entries:
+                self._invalidations += 1
+            self._entries.clear()
+            self._generation = generation
+
+    def get(self, generation: int, command: str, args):
+        self._check_generation(generation)
+        key = (command, args)
+        value = self._entries.get(key)
+        if value is None:
+            self._misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self._hits += 1
+        return value
+
+    def put(self, generation: int, command: str, args, value):
+        self._check_generation(generation)
+        self._entries[(command, args)] = value
+        self._entries.move_to_end((command, args))
+        while len(self._entries) > self._capacity:
+            self._entries.popitem(last=False)
+            self._evictions += 1
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        lookups = self._hits + self._misses
+        return {
+            'size': len(self._entries),
+            'generation': self._generation,
+            'hits': self._hits,
+            'misses': self._misses,
+            'hit_ratio': self._hits / lookups if lookups else 0.0,
+            'evictions': self._evictions,
+            'invalidations': self._invalidations
+        }
@@ -0,0 +1,101 @@
+import json
+import os
+import time
+from collections import OrderedDict
+
+MAX_SESSIONS = 100000
+IDLE_TTL = 30 * 86400
+PAGE_SIZE = 25
+
+
+class Session:
+    __slots__ = ('start', 'end', 'last', 'searched', 'seen')
+
+    def __init__(self, page_size=PAGE_SIZE):
+        self.seen = time.time()
+        self.reset(page_size)
+
+    def reset(self, page_size=PAGE_SIZE):
+        self.start = 0
+        self.end = page_size
+        self.last = None
+        self.searched = None
+
+
+# per-chat state, least recently used first. A session idle for more than ttl
+# seconds, or the oldest one once there are more than capacity, is dropped;
+# a dropped chat simply gets a fresh session on its next command. With a path
+# the sessions survive restarts (load at startup, snapshot at shutdown).
+class SessionStore:
+
+    def __init__(self, capacity=MAX_SESSIONS, ttl=IDLE_TTL, path=None, page_size=PAGE_SIZE):
+        self._capacity = capacity
+        self._ttl = ttl
+        self._path = path
+        self._page_size = page_size
+        self._sessions = OrderedDict()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, chat_id):
+        return chat_id in self._sessions
+
+    def _evict(self, now: float):
+        limit = now - self._ttl
+        while self._sessions:
+            chat_id, session = next(iter(self._sessions.items()))
+            if session.seen >= limit and len(self._sessions) <= self._capacity:
+                break
+            del self._sessions[chat_id]
+
+    def get(self, chat_id: int) -> Session:
+        now = time.time()
+        session = self._sessions.get(chat_id)
+        if session is None:
+            session = Session(self._page_size)
+            self._sessions[chat_id] = session
+        else:
+            self._sessions.move_to_end(chat_id)
+        session.seen = now
+        self._evict(now)
+        return session
+
+    def ids(self) -> list:
+        self._evict(time.time())
+        return list(self._sessions.keys())
+
+    def load(self):
+        if self._path is None or not os.path.exists(self._path):
+            return 0
+        try:
+            with open(self._path, 'r') as file:
+                for line in file:
+                    chat_id, start, end, last, searched, seen = json.loads(line)
+                    session = Session(self._page_size)
+                    session.start, session.end, session.last, session.searched, session.seen = \
+                        start, end, last, searched, seen
+                    self._sessions[chat_id] = session
+        except (IOError, ValueError) as e:
+            print(f'Error reading sessions file: {e}')
+        self._evict(time.time())
+        return len(self._sessions)
+
+    # written to a temporary file first so a crash never leaves a broken one
+    def snapshot(self):
+        if self._path is None:
+            return False
+        rows = [
+            json.dumps([chat_id, s.start, s.end, s.last, s.searched, s.seen])
+            for chat_id, s in list(self._sessions.items())
+        ]
+        try:
+            tmp = self._path + '.tmp'
+            with open(tmp, 'w') as file:
+                for row in rows:
+                    file.write(row + '\n')
+            os.replace(tmp, self._path)
+            return True
+        except IOError as e:
+            print(f'Error writing sessions file: {e}')
+            return False
@@ -1,8 +1,7 @@
 import re
 
 
-def htable_format(headers: list, rows: list, exceeds: bool) -> str:
-    head = '''
+HTABLE_HEAD = '''
                 <head>
                     <style>
                         body {
@@ -45,25 +44,32 @@ def htable_format(headers: list, rows: list, exceeds: bool) -> str:
                 </head>
                 <body>
             '''
-    table = '<table>\n\t<tr>\n'
+HTABLE_FOOTER = (
+    '<footer>*Note: this file doesn\'t contain all records. If you want to check all of them, '
+    '<a href="https://exoplanetarchive.ipac.caltech.edu/cgi-bin/TblView/nph-tblView?app=ExoTbls&config'
+    '=PS" target="_blank">visit the official NASA\'s website</a> or add -a to the /table command</footer>'
+)
+
+
+def htable_head(out, headers: list):
+    out.write(HTABLE_HEAD)
+    out.write('<table>\n\t<tr>\n')
     for h in headers:
-        th = f'\t\t<th id="header"><h5>{h}</h5></th>\n'
-        table += th
-    table += '\t</tr>\n'
+        out.write(f'\t\t<th id="header"><h5>{h}</h5></th>\n')
+    out.write('\t</tr>\n')
+
+
+def htable_row(out, row):
+    out.write('\t<tr>\n')
+    for elem in row:
+        out.write(f'\t\t<th id="record">{elem if elem is not None else ""}</th>\n')
+    out.write('\t</tr>\n')
+
 
-    for row in rows:
-        tr = '\t<tr>\n'
-        for elem in row:
-            th = f'\t\t<th id="record">{elem if elem is not None else ''}</th>\n'
-            tr += th
-        tr += '\t</tr>\n'
-        table += tr
-    table += '</table>\n</body>'
+def htable_tail(out, exceeds: bool):
+    out.write('</table>\n</body>')
     if exceeds:
-        table += ('<footer>*Note: this file doesn\'t contain all records. If you want to check all of them, '
-                  '<a href="https://exoplanetarchive.ipac.caltech.edu/cgi-bin/TblView/nph-tblView?app=ExoTbls&config'
-                  '=PS" target="_blank">visit the official NASA\'s website</a>')
-    return head + table
+        out.write(HTABLE_FOOTER)
 
 
 def get_href_match(string: str):
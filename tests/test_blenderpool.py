@@ -0,0 +1,129 @@
+import asyncio
+import sys
+import pytest
+from src.utils.blenderpool import BlenderPool, RenderError, MARKER
+
+# speaks the worker_script protocol without Blender: 'echo' sends back the
+# worker's pid and its arguments, 'fail' reports an error, 'hang' never answers
+STUB = f'''
+import os, sys, time
+out = sys.stdout.buffer
+
+def reply(status, payload=b''):
+    out.write(b'some blender log line\\n')
+    out.write(b'\\n{MARKER.decode()} ' + status.encode() + b' ' + str(len(payload)).encode() + b'\\n' + payload)
+    out.flush()
+
+reply('ready')
+for line in sys.stdin:
+    job = line.split()
+    if job[0] == 'echo':
+        reply('ok', ' '.join([str(os.getpid())] + job[1:]).encode())
+    elif job[0] == 'fail':
+        reply('error', b'Traceback: boom')
+    elif job[0] == 'hang':
+        time.sleep(60)
+'''
+
+
+@pytest.fixture
+def command(tmp_path):
+    path = tmp_path / 'stub_worker.py'
+    path.write_text(STUB)
+    return [sys.executable, str(path), '--']
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_render_returns_payload(command):
+    async def scenario():
+        pool = BlenderPool([], size=1, command=command)
+        try:
+            return await pool.render('echo', ['1.5', 'a b'])
+        finally:
+            await pool.close()
+
+    pid, *args = run(scenario()).decode().split()
+    assert args == ['1.5', 'ab']
+
+
+def test_render_error_keeps_the_worker(command):
+    async def scenario():
+        pool = BlenderPool([], size=1, command=command)
+        try:
+            before = await pool.render('echo', [])
+            with pytest.raises(RenderError, match='boom'):
+                await pool.render('fail', [])
+            after = await pool.render('echo', [])
+            return before, after
+        finally:
+            await pool.close()
+
+    before, after = run(scenario())
+    assert before == after
+
+
+def test_timeout_respawns_the_worker(command):
+    async def scenario():
+        pool = BlenderPool([], size=1, timeout=1, command=command)
+        try:
+            before = await pool.render('echo', [])
+            with pytest.raises(asyncio.TimeoutError):
+                await pool.render('hang', [])
+            after = await pool.render('echo', [])
+            return before, after
+        finally:
+            await pool.close()
+
+    before, after = run(scenario())
+    assert before != after
+
+
+def test_worker_recycled_after_max_jobs(command):
+    async def scenario():
+        pool = BlenderPool([], size=1, max_jobs=2, command=command)
+        try:
+            return [await pool.render('echo', []) for _ in range(4)]
+        finally:
+            await pool.close()
+
+    pids = run(scenario())
+    assert pids[0] == pids[1]
+    assert pids[1] != pids[2]
+    assert pids[2] == pids[3]
+
+
+def test_concurrent_renders_use_every_slot(command):
+    async def scenario():
+        pool = BlenderPool([], size=2, command=command)
+        try:
+            await pool.start()
+            return await asyncio.gather(*[pool.render('echo', []) for _ in range(6)])
+        finally:
+            await pool.close()
+
+    assert len(set(run(scenario()))) == 2
+
+
+def test_recycled_worker_is_replaced_ahead_of_the_next_job(command):
+    async def scenario():
+        pool = BlenderPool([], size=1, max_jobs=1, command=command)
+        try:
+            await pool.start()
+            first = await pool.render('echo', [])
+            # the replacement starts in the background and takes the slot
+            for _ in range(100):
+                if pool._slots.qsize() == 1:
+                    break
+                await asyncio.sleep(0.05)
+            replacement = pool._slots._queue[0]
+            second = await pool.render('echo', [])
+            return first, second, replacement
+        finally:
+            await pool.close()
+
+    first, second, replacement = run(scenario())
+    assert replacement is not None
+    assert first != second
@@ -0,0 +1,132 @@
+import asyncio
+import os
+import time
+from datetime import datetime, timezone
+from email.utils import format_datetime
+import pytest
+from src.utils import news
+from src.utils.httpserver import HttpServer
+
+DAY = 86400
+
+
+def rss_date(age: float) -> str:
+    return format_datetime(datetime.fromtimestamp(time.time() - age, timezone.utc))
+
+
+def atom_date(age: float) -> str:
+    return datetime.fromtimestamp(time.time() - age, timezone.utc).isoformat().replace('+00:00', 'Z')
+
+
+RSS = f'''<?xml version="1.0"?>
+<rss version="2.0"><channel><title>Stand-in</title>
+<item><title>  First
+   planet  </title><link>https://Example.org/a?utm_source=rss&amp;id=1#top</link><pubDate>{rss_date(DAY)}</pubDate></item>
+<item><title>Shared</title><link>https://example.org/shared?utm_medium=feed</link><pubDate>{rss_date(2 * DAY)}</pubDate></item>
+<item><title>Too old</title><link>https://example.org/old</link><pubDate>{rss_date(30 * DAY)}</pubDate></item>
+<item><title>No link</title></item>
+</channel></rss>'''.encode()
+
+ATOM = f'''<?xml version="1.0" encoding="utf-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom"><title>Stand-in</title>
+<entry><title>Atom entry</title><link rel="self" href="https://example.org/self"/>
+<link href="https://example.org/b#comments"/><updated>{atom_date(3 * DAY)}</updated></entry>
+<entry><title>Shared again</title><link rel="alternate" href="https://example.org/shared"/>
+<published>{atom_date(DAY)}</published></entry>
+</feed>'''.encode()
+
+FEEDS = {'/rss.xml': RSS, '/atom.xml': ATOM, '/broken.xml': b'<rss><channel><item>'}
+
+
+async def serve_feed(request):
+    body = FEEDS.get(request.path)
+    if body is None:
+        return 404, 'text/plain', b''
+    return 200, 'application/xml', body
+
+
+def fetch_all(paths: list, known=()) -> list:
+    async def scenario():
+        server = HttpServer(serve_feed)
+        await server.start()
+        pipeline = news.NewsPipeline([news.FeedSource(f'http://127.0.0.1:{server.port}{path}') for path in paths])
+        try:
+            return await pipeline.run(list(known))
+        finally:
+            await pipeline.close()
+            await server.close()
+
+    return asyncio.run(scenario())
+
+
+def test_rss_items_are_parsed_and_normalized():
+    items = fetch_all(['/rss.xml'])
+    by_link = {item.link: item for item in items}
+    assert 'https://example.org/a?id=1' in by_link
+    assert by_link['https://example.org/a?id=1'].title == 'First planet'
+    assert by_link['https://example.org/a?id=1'].timestamp == pytest.approx(time.time() - DAY, abs=5)
+    assert 'https://example.org/shared' in by_link
+
+
+def test_atom_entries_use_the_alternate_link():
+    links = [item.link for item in fetch_all(['/atom.xml'])]
+    assert 'https://example.org/b' in links
+    assert 'https://example.org/self' not in links
+
+
+def test_links_are_unique_across_feeds_and_newest_first():
+    items = fetch_all(['/rss.xml', '/atom.xml'])
+    links = [item.link for item in items]
+    assert len(links) == len(set(links))
+    assert links.count('https://example.org/shared') == 1
+    timestamps = [item.timestamp for item in items]
+    assert timestamps == sorted(timestamps, reverse=True)
+
+
+def test_expired_items_are_dropped():
+    links = [item.link for item in fetch_all(['/rss.xml'])]
+    assert 'https://example.org/old' not in links
+
+
+def test_broken_or_missing_feeds_are_skipped():
+    links = [item.link for item in fetch_all(['/broken.xml', '/missing.xml', '/atom.xml'])]
+    assert links == ['https://example.org/shared', 'https://example.org/b']
+
+
+def test_merge_keeps_known_timestamps_and_retention():
+    pipeline = news.NewsPipeline([], retention=7 * DAY)
+    now = time.time()
+    known = [
+        news.NewsItem('https://example.org/a', 'A', now - 5 * DAY),
+        news.NewsItem('https://example.org/expired', 'E', now - 8 * DAY)
+    ]
+    fetched = [
+        news.NewsItem('https://example.org/a', 'A again', now),
+        news.NewsItem('https://example.org/c', 'C', now - DAY)
+    ]
+    merged = pipeline.merge(known, fetched)
+    assert [item.link for item in merged] == ['https://example.org/c', 'https://example.org/a']
+    assert merged[1].timestamp == now - 5 * DAY
+
+
+def test_write_news_round_trip(tmp_path):
+    path = str(tmp_path / 'news.txt')
+    items = [news.NewsItem('https://example.org/a', 'A title', 1700000000)]
+    assert news.write_news(items, path)
+    assert not os.path.exists(path + '.tmp')
+    restored = news.read_news(path)
+    assert [(item.link, item.title, item.timestamp) for item in restored] == [('https://example.org/a', 'A title', 1700000000)]
+
+
+def test_failed_write_leaves_the_old_file(tmp_path):
+    path = str(tmp_path / 'news.txt')
+    news.write_news([news.NewsItem('https://example.org/a', 'A', 1)], path)
+    # the temporary file can't be created, the rename never happens
+    os.mkdir(path + '.tmp')
+    assert not news.write_news([news.NewsItem('https://example.org/b', 'B', 2)], path)
+    assert [item.link for item in news.read_news(path)] == ['https://example.org/a']
+
+
+def test_news_source_is_abstract():
+    with pytest.raises(TypeError):
+        news.NewsSource('http://127.0.0.1/')